@@ -0,0 +1,38 @@
+# Gunicorn configuration for serving the E-commerce AI Agent in production.
+# Every setting can be overridden through the environment, e.g.
+#   WEB_CONCURRENCY=4 GUNICORN_THREADS=8 gunicorn -c gunicorn.conf.py
+import multiprocessing
+import os
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+chdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src")
+wsgi_app = "wsgi:app"
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+
+# Worker processes and threads per worker
+workers = _env_int("WEB_CONCURRENCY", min(multiprocessing.cpu_count() * 2 + 1, 8))
+threads = _env_int("GUNICORN_THREADS", 4)
+worker_class = "gthread" if threads > 1 else "sync"
+
+# LLM calls can take a while on CPU-only hosts
+timeout = _env_int("GUNICORN_TIMEOUT", 120)
+graceful_timeout = 30
+keepalive = 5
+
+# Load the app (pandas, matplotlib, the system prompt, the fallback patterns)
+# in the master so workers share those pages copy-on-write.
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") != "0"
+
+# One pooled connection per worker thread unless configured otherwise
+os.environ.setdefault("DB_POOL_SIZE", str(threads))
+
+accesslog = "-"
+errorlog = "-"
+
+def post_fork(server, worker):
+    # Connections and HTTP sessions must never be shared across processes.
+    from app import init_worker
+    init_worker(worker.app.wsgi())
@@ -0,0 +1,81 @@
+import threading
+from contextlib import contextmanager
+
+class AdmissionRejected(Exception):
+    """Raised when a pipeline stage is already running at its in-flight limit."""
+
+    def __init__(self, stage, retry_after):
+        super().__init__(f"Too many requests in stage '{stage}'")
+        self.stage = stage
+        self.retry_after = retry_after
+
+class StageLimiter:
+    """
+    Caps the number of requests in flight in one stage. A request waits at
+    most queue_timeout seconds for a free slot and is rejected after that,
+    so a burst turns into fast 429s instead of an ever-growing queue.
+    """
+
+    def __init__(self, name, max_in_flight, queue_timeout=0.0, retry_after=1):
+        self.name = name
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def try_acquire(self):
+        if self.queue_timeout > 0:
+            acquired = self._slots.acquire(timeout=self.queue_timeout)
+        else:
+            acquired = self._slots.acquire(blocking=False)
+        if acquired:
+            with self._lock:
+                self._in_flight += 1
+        return acquired
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    @contextmanager
+    def slot(self):
+        """Hold a slot for the with-block or raise AdmissionRejected."""
+        if not self.try_acquire():
+            raise AdmissionRejected(self.name, self.retry_after)
+        try:
+            yield
+        finally:
+            self.release()
+
+class AdmissionController:
+    """The stage limiters of one worker process, looked up by stage name."""
+
+    def __init__(self, limits, queue_timeout=0.0, retry_after=None):
+        retry_after = retry_after or {}
+        self.limiters = {
+            stage: StageLimiter(stage, max_in_flight, queue_timeout, retry_after.get(stage, 1))
+            for stage, max_in_flight in limits.items()
+        }
+
+    def limiter(self, stage):
+        return self.limiters[stage]
+
+    def slot(self, stage):
+        return self.limiters[stage].slot()
+
+    def try_acquire(self, stage):
+        return self.limiters[stage].try_acquire()
+
+    def release(self, stage):
+        self.limiters[stage].release()
+
+    def status(self):
+        return {stage: {"in_flight": limiter.in_flight, "limit": limiter.max_in_flight}
+                for stage, limiter in self.limiters.items()}
@@ -0,0 +1,152 @@
+import glob
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+def normalize_question(question):
+    """Lookup key for a question: case, repeated spaces and trailing punctuation are ignored."""
+    return " ".join(question.lower().split()).rstrip("?.! ")
+
+class AnswerStore:
+    """
+    Precomputed /ask responses (answer text, result rows and chart) for the
+    canned questions of FallbackQuerySystem.get_available_queries.
+
+    The store is keyed by data version: the database's data_version counter
+    (bumped by every ingestion) plus the current UTC date, since questions
+    such as "sales today" depend on it. A background thread polls the version
+    and rebuilds the store when it changes; until the rebuild finishes the old
+    answers are no longer served and questions take the normal path. Lookups
+    never touch the database.
+
+    Charts are named after the question and the data version, so workers on
+    the same version share them. Charts of older versions are kept for
+    chart_retention seconds after a worker moves on, since workers that have
+    not refreshed yet still serve them.
+    """
+
+    def __init__(self, db_manager, viz_manager, fallback_system, format_answer, refresh_interval=30,
+                 chart_retention=3600):
+        self.db_manager = db_manager
+        self.viz_manager = viz_manager
+        self.fallback_system = fallback_system
+        # format_answer(query_result, question) -> answer text, as used by /ask
+        self.format_answer = format_answer
+        self.refresh_interval = refresh_interval
+        self.chart_retention = max(chart_retention, 2 * refresh_interval)
+        self.version = None
+        self.built_at = None
+        self._entries = {}
+        self._build_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+
+    def lookup(self, question):
+        """The stored entry ({"response": ..., "query_result": ...}) for a canned question, or None."""
+        return self._entries.get(normalize_question(question))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def current_version(self):
+        return f"{self.db_manager.get_data_version()}@{datetime.now(timezone.utc).date().isoformat()}"
+
+    def refresh(self, force=False):
+        """Rebuild the store if the data version changed (or always with force). Returns True if rebuilt."""
+        with self._build_lock:
+            version = self.current_version()
+            if version == self.version and not force:
+                return False
+            # Stale answers must not be served while the new ones are computed
+            previous_version = self.version
+            self._entries = {}
+            start = time.perf_counter()
+            entries = {}
+            for question in self.fallback_system.get_available_queries():
+                try:
+                    entry = self._compute(question, version)
+                except Exception as e:
+                    logger.warning(f"Could not precompute '{question}': {e}")
+                    continue
+                if entry is not None:
+                    entries[normalize_question(question)] = entry
+            self._entries = entries
+            self.version = version
+            self.built_at = datetime.now().isoformat()
+            self._expire_charts(previous_version, version)
+            logger.info(f"Answer store built for data version {version}: {len(entries)} answers "
+                        f"in {time.perf_counter() - start:.2f}s")
+            return True
+
+    def _compute(self, question, version):
+        sql_query = self.fallback_system.get_fallback_query(question)
+        if not sql_query:
+            return None
+        query_result = self.db_manager.execute_query(sql_query)
+        if not query_result["success"]:
+            # Errors are left to the normal path, which reports them as they happen
+            return None
+        response = {
+            "question": question,
+            "sql_query": sql_query,
+            "answer": self.format_answer(query_result, question),
+            "success": True,
+        }
+        chart = self.viz_manager.create_visualization(query_result, question, sql_query)
+        if chart:
+            response["visualization"] = f"/visualizations/{self._keep_chart(chart, question, version)}"
+        return {"response": response, "query_result": query_result}
+
+    def _keep_chart(self, chart, question, version):
+        """Move a rendered chart to a name of its own, so later renders in the same second cannot replace it."""
+        digest = hashlib.sha1(normalize_question(question).encode("utf-8")).hexdigest()[:16]
+        filename = f"{self._chart_prefix(version)}{digest}.png"
+        os.replace(chart, os.path.join(os.path.dirname(chart), filename))
+        return filename
+
+    @staticmethod
+    def _chart_prefix(version):
+        return f"answer_{hashlib.sha1(version.encode('utf-8')).hexdigest()[:12]}_"
+
+    def _expire_charts(self, previous_version, version):
+        """Start the retention period of the charts just superseded and delete other versions' charts past it."""
+        now = time.time()
+        previous_prefix = self._chart_prefix(previous_version) if previous_version is not None else None
+        current_prefix = self._chart_prefix(version)
+        for path in glob.glob(os.path.join(self.viz_manager.output_dir, "answer_*.png")):
+            filename = os.path.basename(path)
+            try:
+                if previous_prefix and filename.startswith(previous_prefix):
+                    os.utime(path, (now, now))
+                elif not filename.startswith(current_prefix) and now - os.path.getmtime(path) > self.chart_retention:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def start(self):
+        """Start the background refresher of this process (threads do not survive a fork)."""
+        if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+            return self._thread
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="answer-store", daemon=True)
+        self._thread_pid = os.getpid()
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"Answer store refresh failed: {e}")
+            if self._stop.wait(self.refresh_interval):
+                return
@@ -1,9 +1,13 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Blueprint, Response, current_app, g, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 import os
 import sys
 import json
 import logging
+import sqlite3
+import itertools
+import threading
+import time
 from datetime import datetime
 
 # Add the src directory to the Python path
@@ -11,42 +15,219 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from llm_integration import LLMIntegration
 from database_manager import DatabaseManager
+from sharding import ShardedDatabaseManager
 from visualization import VisualizationManager
 from fallback_queries import FallbackQuerySystem
+from startup_profiler import profiler
+from metrics import AgentMetrics, server_timing_header
+from admission import AdmissionController, AdmissionRejected
+from export import ExportError, encode_export
+from answer_store import AnswerStore
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
 # Correctly set static_folder to the absolute path of the 'static' directory
 # This ensures Flask knows where to find index.html, style.css, etc.
-static_folder_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'static')
-app = Flask(__name__, static_folder=static_folder_path, static_url_path='/static')
-CORS(app)
-
-# Initialize components
-try:
-    db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ecommerce_data.db')
-    db_manager = DatabaseManager(db_path)
-    llm = LLMIntegration()
-    viz_manager = VisualizationManager()
-    fallback_system = FallbackQuerySystem()
-    logger.info("All components initialized successfully")
-except Exception as e:
-    logger.error(f"Error initializing components: {e}")
-    raise
+static_folder_path = os.path.join(BASE_DIR, 'static')
+
+bp = Blueprint('agent', __name__)
+
+class AgentComponents:
+    """The components used by the request handlers of one application."""
+
+    def __init__(self, db_manager, llm, viz_manager, fallback_system, metrics=None, admission=None,
+                 answer_store=None):
+        self.db_manager = db_manager
+        self.llm = llm
+        self.viz_manager = viz_manager
+        self.fallback_system = fallback_system
+        self.metrics = metrics or AgentMetrics()
+        self.admission = admission
+        self.answer_store = answer_store
+        self.ready = threading.Event()
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+def _components():
+    return current_app.extensions['ecommerce_agent']
+
+def create_app(config=None):
+    """
+    Application factory.
+    Builds the Flask app and its components. Under a pre-forking server the
+    factory runs once in the master (see gunicorn.conf.py), so the imported
+    modules, the system prompt and the compiled fallback patterns are shared
+    by every worker; call init_worker() after the fork to give each worker
+    its own connection pool and model client.
+    
+    WARM_UP controls the warm-up phase: "sync" (default) runs it before the
+    factory returns, "background" runs it in a thread while /ready reports 503,
+    and "off" skips it: components load on first use and the answer store is
+    first built by its refresher. The factory starts no threads; see
+    start_background_tasks().
+    """
+    app = Flask(__name__, static_folder=static_folder_path, static_url_path='/static')
+    app.config.update(
+        DB_PATH=os.environ.get('DB_PATH', os.path.join(BASE_DIR, 'ecommerce_data.db')),
+        DB_POOL_SIZE=_env_int('DB_POOL_SIZE', 4),
+        # Shard manifest (see sharding.py); when set it replaces DB_PATH
+        DB_SHARDS=os.environ.get('DB_SHARDS'),
+        LLM_MODEL=os.environ.get('LLM_MODEL', 'mistral'),
+        # How long generated SQL is reused for the same question; 0 disables the cache
+        LLM_SQL_CACHE_SECONDS=float(os.environ.get('LLM_SQL_CACHE_SECONDS', '3600')),
+        OLLAMA_HOST=os.environ.get('OLLAMA_HOST', 'http://localhost:11434'),
+        WARM_UP=os.environ.get('WARM_UP', 'sync'),
+        # In-flight limits per worker process for the expensive /ask stages
+        MAX_IN_FLIGHT_LLM=_env_int('MAX_IN_FLIGHT_LLM', 2),
+        MAX_IN_FLIGHT_DB=_env_int('MAX_IN_FLIGHT_DB', _env_int('DB_POOL_SIZE', 4)),
+        MAX_IN_FLIGHT_RENDER=_env_int('MAX_IN_FLIGHT_RENDER', 2),
+        # Exports stream on connections of their own, so they are limited separately
+        MAX_IN_FLIGHT_EXPORT=_env_int('MAX_IN_FLIGHT_EXPORT', 2),
+        ADMISSION_QUEUE_TIMEOUT=float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', '0.1')),
+        # Precomputed answers for the demo questions; "off" disables the store
+        ANSWER_STORE=os.environ.get('ANSWER_STORE', 'on'),
+        ANSWER_STORE_REFRESH_SECONDS=float(os.environ.get('ANSWER_STORE_REFRESH_SECONDS', '30')),
+    )
+    if config:
+        app.config.update(config)
+    CORS(app)
+    
+    # Initialize components
+    try:
+        db_manager = _create_db_manager(app.config, app.config['DB_POOL_SIZE'])
+        with profiler.measure("LLMIntegration()"):
+            llm = LLMIntegration(model=app.config['LLM_MODEL'], base_url=app.config['OLLAMA_HOST'],
+                                 cache_ttl=app.config['LLM_SQL_CACHE_SECONDS'])
+        with profiler.measure("VisualizationManager()"):
+            viz_manager = VisualizationManager()
+        with profiler.measure("FallbackQuerySystem()"):
+            fallback_system = FallbackQuerySystem()
+        logger.info("All components initialized successfully")
+    except Exception as e:
+        logger.error(f"Error initializing components: {e}")
+        raise
+    
+    admission = AdmissionController(
+        {
+            'llm': app.config['MAX_IN_FLIGHT_LLM'],
+            'db': app.config['MAX_IN_FLIGHT_DB'],
+            'render': app.config['MAX_IN_FLIGHT_RENDER'],
+            'export': app.config['MAX_IN_FLIGHT_EXPORT'],
+        },
+        queue_timeout=app.config['ADMISSION_QUEUE_TIMEOUT'],
+        retry_after={'llm': 5, 'db': 1, 'render': 1, 'export': 5},
+    )
+    answer_store = None
+    if app.config['ANSWER_STORE'] != 'off':
+        # Rebuilds run on a connection of their own, never one an admitted /ask is waiting for
+        answer_store = AnswerStore(_create_db_manager(app.config, 1), viz_manager, fallback_system, format_answer,
+                                   refresh_interval=app.config['ANSWER_STORE_REFRESH_SECONDS'])
+    app.extensions['ecommerce_agent'] = AgentComponents(db_manager, llm, viz_manager, fallback_system,
+                                                        admission=admission, answer_store=answer_store)
+    app.register_blueprint(bp)
+    
+    warm_up_mode = app.config['WARM_UP']
+    if warm_up_mode == 'sync':
+        warm_up(app)
+    elif warm_up_mode != 'background':
+        app.extensions['ecommerce_agent'].ready.set()
+    return app
+
+def _create_db_manager(config, pool_size):
+    if config['DB_SHARDS']:
+        with profiler.measure("ShardedDatabaseManager()"):
+            return ShardedDatabaseManager(config['DB_SHARDS'], pool_size=pool_size)
+    with profiler.measure("DatabaseManager()"):
+        return DatabaseManager(config['DB_PATH'], pool_size=pool_size)
+
+def warm_up(app):
+    """
+    Load everything the first request would otherwise pay for: the model in
+    Ollama, the database schema and the plotting stack (by rendering a figure).
+    A failing step is logged and recorded by the profiler but does not block
+    readiness, since the fallback system can still answer without it.
+    """
+    components = app.extensions['ecommerce_agent']
+    steps = [
+        ("warm-up: load model", components.llm.warm_up),
+        ("warm-up: load schema", components.db_manager.warm_up),
+        ("warm-up: render first figure", components.viz_manager.warm_up),
+    ]
+    if components.answer_store is not None:
+        steps.append(("warm-up: precompute answers", components.answer_store.refresh))
+    for name, step in steps:
+        try:
+            with profiler.measure(name, kind="warm-up"):
+                step()
+        except Exception as e:
+            logger.warning(f"{name} failed: {e}")
+    components.ready.set()
+    logger.info("Warm-up complete\n" + profiler.format_report())
+
+def _start_background_warm_up(app):
+    thread = threading.Thread(target=warm_up, args=(app,), name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+def start_background_tasks(app):
+    """
+    Start the threads of this process: the background warm-up and the answer
+    store refresher, which builds the store first if warm-up did not. A
+    pre-forking server must call this after the fork: a worker forked while
+    such a thread holds the pool, build or plotting locks would inherit them
+    held, with no thread left to release them.
+    """
+    components = app.extensions['ecommerce_agent']
+    if app.config['WARM_UP'] == 'background' and not components.ready.is_set():
+        _start_background_warm_up(app)
+    if components.answer_store is not None:
+        # Keeps the store in line with the data
+        components.answer_store.start()
+
+def init_worker(app):
+    """Give a freshly forked worker process its own connection pool and model client, and start its threads."""
+    components = app.extensions['ecommerce_agent']
+    components.db_manager.reset_pool()
+    if components.answer_store is not None:
+        components.answer_store.db_manager.reset_pool()
+    components.llm.reset_client()
+    start_background_tasks(app)
+    logger.info(f"Worker {os.getpid()} initialized")
+
+@bp.before_app_request
+def _start_request_timer():
+    g.request_start = time.perf_counter()
+    g.stage_timings = []
+
+@bp.after_app_request
+def _record_request(response):
+    start = g.get('request_start')
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    _components().metrics.record_request(route, request.method, response.status_code, elapsed)
+    if request.endpoint == 'agent.ask_question':
+        response.headers['Server-Timing'] = server_timing_header(g.get('stage_timings', []), total=elapsed)
+    return response
 
 # Route to serve the main HTML file from the static folder
-@app.route('/')
+@bp.route('/')
 def index():
-    return send_from_directory(app.static_folder, 'index.html')
+    return send_from_directory(current_app.static_folder, 'index.html')
 
 # Route to serve visualization images from the 'visualizations' folder
-@app.route('/visualizations/<filename>')
+@bp.route('/visualizations/<filename>')
 def serve_visualization(filename):
     # Construct the absolute path to the 'visualizations' folder
     # This assumes 'visualizations' is at the project root level, like 'static' and 'src'
-    visualizations_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'visualizations')
+    visualizations_dir = os.path.join(BASE_DIR, 'visualizations')
     return send_from_directory(visualizations_dir, filename)
 
 def format_answer(query_result, user_question):
@@ -131,9 +312,71 @@ def format_answer(query_result, user_question):
         logger.error(f"Error formatting answer: {e}")
         return f"Error formatting results: {str(e)}"
 
-@app.route("/ask", methods=["POST"])
+def _generate_sql(components, user_question, timings):
+    """
+    Turn a question into SQL: cached LLM output, then the LLM, then the
+    fallback system. Returns None if nothing understood the question and
+    raises AdmissionRejected if the model is saturated and the fallback
+    system cannot help.
+    """
+    llm = components.llm
+    fallback_system = components.fallback_system
+    metrics = components.metrics
+    admission = components.admission
+    
+    # Try to generate SQL query using LLM first (or reuse what it generated before)
+    sql_query = llm.get_cached_query(user_question)
+    metrics.record_cache("llm_sql", sql_query is not None)
+    if not sql_query:
+        if admission.try_acquire("llm"):
+            try:
+                with metrics.stage("llm", timings):
+                    sql_query = llm.generate_sql_query(user_question)
+            finally:
+                admission.release("llm")
+            if not sql_query:
+                metrics.record_error("llm")
+        else:
+            # The model is saturated: questions the fallback system understands
+            # skip the LLM queue, everything else is turned away right away.
+            with metrics.stage("fallback", timings):
+                fallback_query = fallback_system.get_fallback_query(user_question)
+            if not fallback_query:
+                metrics.record_admission("llm", "rejected")
+                raise AdmissionRejected("llm", admission.limiter("llm").retry_after)
+            metrics.record_admission("llm", "bypassed")
+            logger.info("LLM is at its in-flight limit, answering with the fallback system")
+            sql_query = fallback_query
+    
+    # If LLM fails, try fallback system
+    if not sql_query:
+        logger.warning("LLM failed to generate query, trying fallback system")
+        with metrics.stage("fallback", timings):
+            sql_query = fallback_system.get_fallback_query(user_question)
+        
+        if not sql_query:
+            metrics.record_error("fallback")
+    return sql_query
+
+def _busy_response(rejection):
+    logger.warning(f"Rejected request: {rejection}")
+    response = jsonify({
+        "error": "The server is busy. Please retry shortly.",
+        "stage": rejection.stage,
+        "success": False
+    })
+    response.headers["Retry-After"] = str(rejection.retry_after)
+    return response, 429
+
+@bp.route("/ask", methods=["POST"])
 def ask_question():
     """Main endpoint for asking questions."""
+    components = _components()
+    db_manager = components.db_manager
+    viz_manager = components.viz_manager
+    metrics = components.metrics
+    admission = components.admission
+    timings = g.stage_timings
     try:
         data = request.get_json()
         if not data or "question" not in data:
@@ -145,40 +388,59 @@ def ask_question():
         
         logger.info(f"Received question: {user_question}")
         
-        # Try to generate SQL query using LLM first
-        sql_query = llm.generate_sql_query(user_question)
+        answer_store = components.answer_store
+        if answer_store is not None:
+            with metrics.stage("answer_store", timings):
+                stored = answer_store.lookup(user_question)
+            metrics.record_cache("answer_store", stored is not None)
+            if stored is not None:
+                response = dict(stored["response"])
+                response["question"] = user_question
+                response["timestamp"] = datetime.now().isoformat()
+                response["answer_store"] = {"data_version": answer_store.version, "built_at": answer_store.built_at}
+                return jsonify(response)
         
-        # If LLM fails, try fallback system
+        sql_query = _generate_sql(components, user_question, timings)
         if not sql_query:
-            logger.warning("LLM failed to generate query, trying fallback system")
-            sql_query = fallback_system.get_fallback_query(user_question)
-            
-            if not sql_query:
-                return jsonify({
-                    "error": "Could not understand the question. Please try rephrasing or use one of the demo questions.",
-                    "success": False
-                }), 400
+            return jsonify({
+                "error": "Could not understand the question. Please try rephrasing or use one of the demo questions.",
+                "success": False
+            }), 400
         
         logger.info(f"Generated SQL query: {sql_query}")
         
         # Execute the query
-        query_result = db_manager.execute_query(sql_query)
+        try:
+            with admission.slot("db"), metrics.stage("sql", timings):
+                query_result = db_manager.execute_query(sql_query)
+        except AdmissionRejected:
+            metrics.record_admission("db", "rejected")
+            raise
         
         if not query_result["success"]:
+            metrics.record_error("sql")
             logger.error(f"Query execution failed: {query_result['error']}")
         
         # Format the answer
-        answer = format_answer(query_result, user_question)
+        with metrics.stage("format", timings):
+            answer = format_answer(query_result, user_question)
         
         # Create visualization
         visualization_path = None
+        visualization_skipped = False
         if query_result["success"]:
             try:
-                visualization_path = viz_manager.create_visualization(query_result, user_question, sql_query)
+                with admission.slot("render"), metrics.stage("render", timings):
+                    visualization_path = viz_manager.create_visualization(query_result, user_question, sql_query)
                 if visualization_path:
                     # Return only the filename, as Flask will serve it from /visualizations/
                     visualization_path = os.path.basename(visualization_path)
                     logger.info(f"Visualization created: {visualization_path}")
+            except AdmissionRejected:
+                # The answer is already computed; return it without a chart rather than failing
+                visualization_skipped = True
+                metrics.record_admission("render", "skipped")
+                logger.warning("Renderer is at its in-flight limit, skipping the visualization")
             except Exception as e:
                 logger.error(f"Visualization creation failed: {e}")
         
@@ -192,17 +454,128 @@ def ask_question():
         
         if visualization_path:
             response["visualization"] = f"/visualizations/{visualization_path}" # Prepend Flask route
+        elif visualization_skipped:
+            response["visualization_skipped"] = "Server busy, chart not rendered"
+        
+        if query_result.get("rewrite"):
+            response["query_rewrite"] = query_result["rewrite"]
+        if query_result.get("partition_pruning"):
+            response["partition_pruning"] = query_result["partition_pruning"]
+        if query_result.get("sharding"):
+            response["sharding"] = query_result["sharding"]
         
         if not query_result["success"]:
             response["error"] = query_result['error']
         
         return jsonify(response)
     
+    except AdmissionRejected as e:
+        return _busy_response(e)
+    
     except Exception as e:
+        metrics.record_error("internal")
         logger.error(f"Unexpected error in ask_question: {e}")
         return jsonify({"error": f"Internal server error: {str(e)}", "success": False}), 500
 
-@app.route("/health", methods=["GET"])
+@bp.route("/export", methods=["GET", "POST"])
+def export_results():
+    """
+    Stream the complete result of a question (or of a SQL query returned by
+    /ask) as CSV, JSON lines or Parquet, optionally gzip-compressed. Rows are
+    fetched and encoded chunk by chunk, so memory does not grow with the result.
+    """
+    components = _components()
+    db_manager = components.db_manager
+    metrics = components.metrics
+    admission = components.admission
+    data = request.get_json(silent=True) or request.args
+    export_format = str(data.get("format", "csv")).lower()
+    use_gzip = str(data.get("gzip", "false")).lower() in ("1", "true", "yes")
+    try:
+        sql_query = (data.get("sql_query") or "").strip()
+        user_question = (data.get("question") or "").strip()
+        if sql_query:
+            if not sql_query.upper().startswith(("SELECT", "WITH")) or not db_manager.validate_query(sql_query):
+                return jsonify({"error": "Only read-only SELECT queries can be exported", "success": False}), 400
+        elif user_question:
+            sql_query = _generate_sql(components, user_question, g.stage_timings)
+            if not sql_query:
+                return jsonify({
+                    "error": "Could not understand the question. Please try rephrasing or use one of the demo questions.",
+                    "success": False
+                }), 400
+        else:
+            return jsonify({"error": "No question or sql_query provided", "success": False}), 400
+        
+        logger.info(f"Exporting {export_format} for SQL query: {sql_query}")
+        
+        # The export slot and the stream's own connection are held until the download finishes;
+        # /ask's db slots and the connection pool are not touched
+        if not admission.try_acquire("export"):
+            metrics.record_admission("export", "rejected")
+            raise AdmissionRejected("export", admission.limiter("export").retry_after)
+        # Client SQL must not write, whatever validate_query lets through
+        chunks = db_manager.stream_query(sql_query, read_only=True)
+        try:
+            # A Parquet schema is fixed up front, so it is derived from the complete result
+            column_types = db_manager.get_result_types(sql_query, read_only=True) if export_format == "parquet" else None
+            # Run the query now so that SQL errors still get a proper error response
+            columns, first_rows = next(chunks)
+            body, mimetype, extension = encode_export(
+                export_format, columns,
+                itertools.chain([first_rows], (rows for _, rows in chunks)), gzip=use_gzip,
+                column_types=column_types)
+        except Exception:
+            chunks.close()
+            admission.release("export")
+            raise
+        
+        def generate():
+            try:
+                yield from body
+            finally:
+                chunks.close()
+                admission.release("export")
+        
+        filename = f"export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+        return Response(stream_with_context(generate()), mimetype=mimetype,
+                        headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+    
+    except AdmissionRejected as e:
+        return _busy_response(e)
+    
+    except ExportError as e:
+        return jsonify({"error": str(e), "success": False}), 400
+    
+    except sqlite3.Error as e:
+        metrics.record_error("sql")
+        return jsonify({"error": f"Error executing query: {e}", "success": False}), 400
+    
+    except Exception as e:
+        metrics.record_error("internal")
+        logger.error(f"Unexpected error in export_results: {e}")
+        return jsonify({"error": f"Internal server error: {str(e)}", "success": False}), 500
+
+@bp.route("/eligibility", methods=["GET"])
+def eligibility_lookup():
+    """
+    Product eligibility as of a point in time (as_of=YYYY-MM-DD[ HH:MM:SS], UTC),
+    or the current snapshot without as_of. item_id restricts it to one product.
+    """
+    as_of = request.args.get("as_of") or None
+    item_id = request.args.get("item_id") or None
+    result = _components().db_manager.get_eligibility_as_of(as_of=as_of, item_id=item_id)
+    if not result["success"]:
+        return jsonify({"error": result["error"], "success": False}), 400
+    return jsonify({
+        "success": True,
+        "as_of": as_of,
+        "columns": result["columns"],
+        "data": [list(row) for row in result["data"]],
+        "row_count": len(result["data"])
+    })
+
+@bp.route("/health", methods=["GET"])
 def health_check():
     """Health check endpoint."""
     return jsonify({
@@ -211,13 +584,38 @@ def health_check():
         "timestamp": datetime.now().isoformat()
     })
 
+@bp.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus scrape endpoint."""
+    return Response(_components().metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@bp.route("/ready", methods=["GET"])
+def readiness_check():
+    """Readiness endpoint: 503 until the warm-up phase has finished."""
+    ready = _components().ready.is_set()
+    return jsonify({
+        "ready": ready,
+        "startup": profiler.report(),
+        "timestamp": datetime.now().isoformat()
+    }), 200 if ready else 503
+
 if __name__ == "__main__":
     print("Starting E-commerce AI Agent...")
     print("Available endpoints:")
     print("  GET  / - Frontend")
     print("  GET  /health - Health check")
+    print("  GET  /ready - Readiness check (after warm-up)")
+    print("  GET  /metrics - Prometheus metrics")
     print("  POST /ask - Ask a question")
+    print("  POST /export - Download the full result as CSV, JSON lines or Parquet")
+    print("  GET  /eligibility - Product eligibility now or as of a point in time")
     print("  GET  /visualizations/<filename> - Serve visualization images")
     
+    print("For production use: gunicorn -c gunicorn.conf.py")
+    
     logger.info("Starting E-commerce AI Agent server")
+    app = create_app()
+    # With the reloader, only the child process that serves requests needs them
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_tasks(app)
     app.run(debug=True, host="0.0.0.0", port=5000)
@@ -0,0 +1,203 @@
+import argparse
+import json
+import os
+import platform
+import re
+import sqlite3
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+from database_manager import DatabaseManager
+from fallback_queries import FallbackQuerySystem
+from llm_integration import LLMIntegration
+from synthetic_data import SyntheticDataGenerator, parse_row_count
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+DEFAULT_SIZES = ["1M", "10M", "100M"]
+
+_FEW_SHOT_RE = re.compile(r"^\s*User:\s*(.+?)\s*\n\s*SQL:\s*(.+?)\s*$", re.MULTILINE)
+
+def collect_queries():
+    """Every FallbackQuerySystem query and every few-shot SQL in the LLM prompt, without duplicates."""
+    queries = []
+    seen = set()
+    for pattern, sql in FallbackQuerySystem().query_patterns.items():
+        if sql not in seen:
+            seen.add(sql)
+            queries.append({"name": f"fallback: {pattern}", "source": "fallback", "sql": sql})
+    for question, sql in _FEW_SHOT_RE.findall(LLMIntegration().system_prompt):
+        if sql not in seen:
+            seen.add(sql)
+            queries.append({"name": f"prompt: {question}", "source": "prompt", "sql": sql})
+    return queries
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+def _max_rss_bytes():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss if sys.platform == "darwin" else rss * 1024
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def describe_database(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = {table: conn.execute(f"SELECT COUNT(*) FROM {table};").fetchone()[0]
+                for table in ("total_sales_metrics", "ad_sales_metrics", "product_eligibility")}
+    finally:
+        conn.close()
+    return {"path": os.path.abspath(db_path), "size_bytes": os.path.getsize(db_path), "rows": rows}
+
+def benchmark_database(db_path, queries, repeat=5, warmup=1):
+    """
+    Run each query through DatabaseManager.execute_query: `warmup` untimed
+    runs, `repeat` timed runs, then one run under tracemalloc for the peak
+    Python memory (result rows and conversion; SQLite's own page cache is not
+    included, see the run's process_max_rss_bytes for the whole process).
+    """
+    db_manager = DatabaseManager(db_path, pool_size=1)
+    results = []
+    for query in queries:
+        for _ in range(warmup):
+            db_manager.execute_query(query["sql"])
+        timings = []
+        outcome = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            outcome = db_manager.execute_query(query["sql"])
+            timings.append(time.perf_counter() - start)
+        tracemalloc.start()
+        db_manager.execute_query(query["sql"])
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        entry = {
+            "name": query["name"],
+            "source": query["source"],
+            "sql": query["sql"],
+            "success": outcome["success"],
+            "rows": len(outcome["data"]) if outcome["success"] else None,
+            "latency_ms": {
+                "min": round(min(timings) * 1000, 3),
+                "p50": round(percentile(timings, 0.5) * 1000, 3),
+                "p95": round(percentile(timings, 0.95) * 1000, 3),
+                "max": round(max(timings) * 1000, 3),
+                "mean": round(sum(timings) / len(timings) * 1000, 3),
+            },
+            "python_peak_bytes": peak,
+        }
+        if not outcome["success"]:
+            entry["error"] = outcome["error"]
+        for key in ("rewrite", "partition_pruning"):
+            if outcome.get(key):
+                entry[key] = outcome[key]
+        results.append(entry)
+        print(f"  {entry['latency_ms']['p50']:>10.2f} ms  {query['name']}")
+    db_manager.reset_pool()
+    return results
+
+def run_benchmark(sizes=None, db_paths=None, work_dir="benchmark_data", repeat=5, warmup=1, days=365, seed=42):
+    """
+    Benchmark synthetic databases of the given sizes (generated into work_dir
+    once and reused afterwards) and/or existing database files. Returns a
+    JSON-serialisable report.
+    """
+    queries = collect_queries()
+    report = {
+        "version": _git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "runs": [],
+    }
+    targets = []
+    for size in sizes or []:
+        rows = parse_row_count(size)
+        db_path = os.path.join(work_dir, f"synthetic_{size}_{days}d_seed{seed}.db")
+        if not os.path.exists(db_path):
+            os.makedirs(work_dir, exist_ok=True)
+            print(f"Generating {size} rows into {db_path}")
+            SyntheticDataGenerator.for_rows(db_path, rows, days=days, seed=seed).generate()
+        targets.append((size, db_path))
+    targets.extend((os.path.basename(path), path) for path in db_paths or [])
+    for label, db_path in targets:
+        print(f"Benchmarking {label} ({db_path})")
+        run = {
+            "label": label,
+            "database": describe_database(db_path),
+            "queries": benchmark_database(db_path, queries, repeat=repeat, warmup=warmup),
+        }
+        # Peak RSS of the whole benchmark process so far (it never decreases), not of one query or run
+        run["process_max_rss_bytes"] = _max_rss_bytes()
+        report["runs"].append(run)
+    return report
+
+def compare_reports(baseline, current):
+    """Lines comparing p50 latency per (run label, query) between two reports."""
+    lines = [f"{'run':<18} {'baseline ms':>12} {'current ms':>12} {'change':>8}  query"]
+    baseline_latency = {(run["label"], query["sql"]): query["latency_ms"]["p50"]
+                        for run in baseline["runs"] for query in run["queries"]}
+    for run in current["runs"]:
+        for query in run["queries"]:
+            before = baseline_latency.get((run["label"], query["sql"]))
+            after = query["latency_ms"]["p50"]
+            if before is None:
+                change = "new"
+                before_text = "-"
+            else:
+                change = f"{after / before:.2f}x" if before else "-"
+                before_text = f"{before:.2f}"
+            lines.append(f"{run['label']:<18} {before_text:>12} {after:>12.2f} {change:>8}  {query['name']}")
+    return lines
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the fallback and few-shot SQL queries against synthetic or existing databases.")
+    parser.add_argument("--sizes", default=",".join(DEFAULT_SIZES),
+                        help="Comma-separated total_sales_metrics row counts to generate, e.g. 1M,10M,100M "
+                             "(empty to skip)")
+    parser.add_argument("--db", action="append", default=[], help="Also benchmark an existing database file")
+    parser.add_argument("--work-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                                                           "benchmark_data"),
+                        help="Where generated databases are kept between runs")
+    parser.add_argument("--days", type=int, default=365, help="Days of history in generated databases")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per query")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed runs per query before timing")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--compare", help="Earlier JSON report to compare p50 latencies against")
+    args = parser.parse_args()
+
+    sizes = [size.strip() for size in args.sizes.split(",") if size.strip()]
+    report = run_benchmark(sizes=sizes, db_paths=args.db, work_dir=args.work_dir, repeat=args.repeat,
+                           warmup=args.warmup, days=args.days, seed=args.seed)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print("\n".join(compare_reports(baseline, report)))
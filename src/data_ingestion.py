@@ -1,18 +1,127 @@
-import pandas as pd
 import sqlite3
 import os
+import sys
+import argparse
+from datetime import date, datetime
+
+from partitioning import (CATALOG_DDL, FACT_COLUMNS, PARTITIONED_VIEWS, archive_schema_name, load_catalog,
+                          month_bounds, partition_table_name, view_sql)
+from schema import ELIGIBILITY_VIEWS, TABLE_COLUMNS, eligibility_view_sql
+
+LAYOUTS = ("compact", "legacy")
+
+# Source values -> storage values (s is the staging row)
+ITEM_ID_SQL = ("CASE WHEN typeof(s.item_id) = 'real' AND s.item_id = CAST(s.item_id AS INTEGER) "
+               "THEN CAST(CAST(s.item_id AS INTEGER) AS TEXT) ELSE CAST(s.item_id AS TEXT) END")
+DAY_SQL = "CAST(julianday(substr(s.date, 1, 10)) - 2440587.5 AS INTEGER)"
+TIMESTAMP_MS_SQL = "CAST(ROUND((julianday(s.eligibility_datetime_utc) - 2440587.5) * 86400000) AS INTEGER)"
+ELIGIBLE_SQL = ("CASE WHEN upper(trim(CAST(s.eligibility AS TEXT))) "
+                "IN ('1', '1.0', 'TRUE', 'YES', 'Y', 'ELIGIBLE') THEN 1 ELSE 0 END")
+
+# item_id has INTEGER affinity like the original columns: whole numbers are
+# stored (and compared, and sorted) as integers, anything else as text
+ITEMS_COLUMNS = """item_key INTEGER PRIMARY KEY,
+        item_id INTEGER NOT NULL UNIQUE"""
+
+COMPACT_SCHEMA = [
+    f"CREATE TABLE IF NOT EXISTS items ({ITEMS_COLUMNS});",
+    """CREATE TABLE IF NOT EXISTS eligibility_messages (
+        message_key INTEGER PRIMARY KEY,
+        message TEXT NOT NULL UNIQUE
+    );""",
+    # Base fact tables; new rows go to the monthly partitions listed in fact_partitions
+    f"CREATE TABLE IF NOT EXISTS total_sales_fact ({FACT_COLUMNS['total_sales_fact']});",
+    "CREATE INDEX IF NOT EXISTS idx_total_sales_fact_day ON total_sales_fact(day, item_key);",
+    "CREATE INDEX IF NOT EXISTS idx_total_sales_fact_item ON total_sales_fact(item_key, day);",
+    f"CREATE TABLE IF NOT EXISTS ad_sales_fact ({FACT_COLUMNS['ad_sales_fact']});",
+    "CREATE INDEX IF NOT EXISTS idx_ad_sales_fact_day ON ad_sales_fact(day, item_key);",
+    "CREATE INDEX IF NOT EXISTS idx_ad_sales_fact_item ON ad_sales_fact(item_key, day);",
+    CATALOG_DDL,
+    """CREATE TABLE IF NOT EXISTS eligibility_fact (
+        eligibility_ts INTEGER NOT NULL,
+        item_key INTEGER NOT NULL REFERENCES items(item_key),
+        eligible INTEGER NOT NULL CHECK (eligible IN (0, 1)),
+        message_key INTEGER REFERENCES eligibility_messages(message_key)
+    );""",
+    "CREATE INDEX IF NOT EXISTS idx_eligibility_fact_item_ts ON eligibility_fact(item_key, eligibility_ts);",
+    # Latest eligibility record per item, maintained at ingest
+    """CREATE TABLE IF NOT EXISTS eligibility_current (
+        item_key INTEGER PRIMARY KEY REFERENCES items(item_key),
+        eligibility_ts INTEGER NOT NULL,
+        eligible INTEGER NOT NULL CHECK (eligible IN (0, 1)),
+        message_key INTEGER REFERENCES eligibility_messages(message_key)
+    );""",
+]
+
+# Counter bumped on every load, so readers (e.g. the answer store) can tell the data changed
+DATA_VERSION_DDL = """CREATE TABLE IF NOT EXISTS data_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    );"""
+
+# Fold a batch of encoded eligibility rows into eligibility_current. The bare
+# columns take their values from the row with the latest timestamp per item.
+UPDATE_CURRENT_ELIGIBILITY = """INSERT INTO eligibility_current (eligibility_ts, item_key, eligible, message_key)
+    SELECT MAX(eligibility_ts), item_key, eligible, message_key FROM {source} WHERE true GROUP BY item_key
+    ON CONFLICT (item_key) DO UPDATE SET
+        eligibility_ts = excluded.eligibility_ts,
+        eligible = excluded.eligible,
+        message_key = excluded.message_key
+    WHERE excluded.eligibility_ts >= eligibility_current.eligibility_ts;"""
+
+# Columns of the rows load_encoded() takes, per table in TABLE_COLUMNS
+ENCODED_COLUMNS = {
+    "total_sales_metrics": FACT_COLUMNS["total_sales_fact"],
+    "ad_sales_metrics": FACT_COLUMNS["ad_sales_fact"],
+    "product_eligibility": "eligibility_ts INTEGER, item_key INTEGER, eligible INTEGER, message_key INTEGER",
+}
+
+# How each staged table is encoded into the compact layout
+COMPACT_LOADS = {
+    "total_sales_metrics": f"""INSERT INTO {{target}} (day, item_key, total_sales, total_units_ordered)
+        SELECT {DAY_SQL}, i.item_key, s.total_sales, s.total_units_ordered
+        FROM {{staging}} s JOIN items i ON i.item_id = {ITEM_ID_SQL};""",
+    "ad_sales_metrics": f"""INSERT INTO {{target}} (day, item_key, ad_sales, impressions, ad_spend, clicks, units_sold)
+        SELECT {DAY_SQL}, i.item_key, s.ad_sales, s.impressions, s.ad_spend, s.clicks, s.units_sold
+        FROM {{staging}} s JOIN items i ON i.item_id = {ITEM_ID_SQL};""",
+    "product_eligibility": f"""INSERT INTO {{target}} (eligibility_ts, item_key, eligible, message_key)
+        SELECT {TIMESTAMP_MS_SQL}, i.item_key, {ELIGIBLE_SQL}, m.message_key
+        FROM {{staging}} s JOIN items i ON i.item_id = {ITEM_ID_SQL}
+        LEFT JOIN eligibility_messages m ON m.message = s.message;""",
+}
+
+def _sqlite_value(value):
+    """Convert pandas/numpy scalars to values sqlite3 can bind."""
+    if value is None:
+        return None
+    if hasattr(value, "item") and not isinstance(value, (str, bytes)):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
 
 class DataIngestion:
-    def __init__(self, db_name="ecommerce_data.db"):
+    def __init__(self, db_name="ecommerce_data.db", layout="compact", db_path=None):
         # Construct the database path relative to the script location
         # This places ecommerce_data.db in the root of e_commerce_ai_agent_final
-        self.db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", db_name)
+        self.db_path = db_path or os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", db_name)
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unknown layout '{layout}', expected one of {LAYOUTS}")
+        self.layout = layout
         self.conn = None
         self.cursor = None
 
     def connect(self):
         self.conn = sqlite3.connect(self.db_path)
         self.cursor = self.conn.cursor()
+        self._attached = {}
+        # ATTACH is not allowed inside a transaction, so archives are attached up front
+        for archive_path in sorted({p.archive_path for p in load_catalog(self.cursor) if p.archive_path}):
+            self._attach_archive(archive_path)
 
     def close(self):
         if self.conn:
@@ -21,27 +130,14 @@ class DataIngestion:
     def create_tables(self):
         self.connect()
         try:
-            self.cursor.execute("""CREATE TABLE IF NOT EXISTS total_sales_metrics (
-                date TEXT,
-                item_id TEXT,
-                total_sales REAL,
-                total_units_ordered INTEGER
-            );""")
-            self.cursor.execute("""CREATE TABLE IF NOT EXISTS ad_sales_metrics (
-                date TEXT,
-                item_id TEXT,
-                ad_sales REAL,
-                impressions INTEGER,
-                ad_spend REAL,
-                clicks INTEGER,
-                units_sold INTEGER
-            );""")
-            self.cursor.execute("""CREATE TABLE IF NOT EXISTS product_eligibility (
-                eligibility_datetime_utc TEXT,
-                item_id TEXT,
-                eligibility TEXT,
-                message TEXT
-            );""")
+            if self.layout == "compact":
+                for statement in COMPACT_SCHEMA:
+                    self.cursor.execute(statement)
+                self._upgrade_items()
+                self._rebuild_views()
+                self._backfill_current_eligibility()
+            else:
+                self._create_legacy_tables()
             self.conn.commit()
             print("Tables created successfully.")
         except sqlite3.Error as e:
@@ -49,19 +145,293 @@ class DataIngestion:
         finally:
             self.close()
 
-    def insert_data(self, df, table_name):
+    def _create_legacy_tables(self):
+        self.cursor.execute("""CREATE TABLE IF NOT EXISTS total_sales_metrics (
+            date TEXT,
+            item_id TEXT,
+            total_sales REAL,
+            total_units_ordered INTEGER
+        );""")
+        self.cursor.execute("""CREATE TABLE IF NOT EXISTS ad_sales_metrics (
+            date TEXT,
+            item_id TEXT,
+            ad_sales REAL,
+            impressions INTEGER,
+            ad_spend REAL,
+            clicks INTEGER,
+            units_sold INTEGER
+        );""")
+        self.cursor.execute("""CREATE TABLE IF NOT EXISTS product_eligibility (
+            eligibility_datetime_utc TEXT,
+            item_id TEXT,
+            eligibility TEXT,
+            message TEXT
+        );""")
+        self.cursor.execute("""CREATE INDEX IF NOT EXISTS idx_product_eligibility_item_time
+            ON product_eligibility(item_id, eligibility_datetime_utc);""")
+        # One row per item (the history may repeat a timestamp), found by a seek on the index;
+        # recreated so that files made with the earlier MAX() view pick it up
+        self.cursor.execute("DROP VIEW IF EXISTS current_product_eligibility;")
+        self.cursor.execute("""CREATE VIEW current_product_eligibility AS
+            SELECT p.* FROM (SELECT DISTINCT item_id FROM product_eligibility) i
+            JOIN product_eligibility p ON p.rowid = (
+                SELECT h.rowid FROM product_eligibility h WHERE h.item_id = i.item_id
+                ORDER BY h.eligibility_datetime_utc DESC LIMIT 1);""")
+
+    def detect_layout(self):
+        """Return "compact", "legacy" or None (empty database) for the existing file."""
+        self.connect()
+        try:
+            self.cursor.execute("SELECT type FROM sqlite_master WHERE name = 'total_sales_metrics';")
+            row = self.cursor.fetchone()
+        finally:
+            self.close()
+        if row is None:
+            return None
+        return "compact" if row[0] == "view" else "legacy"
+
+    def insert_rows(self, table_name, columns, rows):
+        """Insert rows given in the columns of one of the tables in TABLE_COLUMNS."""
+        if table_name not in TABLE_COLUMNS:
+            raise ValueError(f"Unknown table '{table_name}'")
+        rows = [tuple(_sqlite_value(value) for value in row) for row in rows]
         self.connect()
         try:
-            df.to_sql(table_name, self.conn, if_exists="append", index=False)
+            if self.layout == "compact":
+                self._load_compact(table_name, columns, rows)
+            else:
+                placeholders = ", ".join("?" for _ in columns)
+                self.cursor.executemany(
+                    f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders});", rows)
+            self._bump_data_version()
             self.conn.commit()
-            print(f"Data inserted into {table_name} successfully.")
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        finally:
+            self.close()
+
+    def _bump_data_version(self):
+        self.cursor.execute(DATA_VERSION_DDL)
+        self.cursor.execute("INSERT INTO data_version (id, version) VALUES (1, 1) "
+                            "ON CONFLICT (id) DO UPDATE SET version = version + 1;")
+
+    def _load_compact(self, table_name, columns, rows):
+        staging = f"staging_{table_name}"
+        self.cursor.execute(f"DROP TABLE IF EXISTS temp.{staging};")
+        self.cursor.execute(f"CREATE TEMP TABLE {staging} ({', '.join(TABLE_COLUMNS[table_name])});")
+        placeholders = ", ".join("?" for _ in columns)
+        self.cursor.executemany(f"INSERT INTO temp.{staging} ({', '.join(columns)}) VALUES ({placeholders});", rows)
+        self._encode_staged(table_name, f"temp.{staging}")
+        self.cursor.execute(f"DROP TABLE temp.{staging};")
+
+    def _encode_staged(self, table_name, staging):
+        """Move staged rows (original column format) into the compact tables."""
+        self.cursor.execute(f"INSERT OR IGNORE INTO items (item_id) SELECT DISTINCT {ITEM_ID_SQL} "
+                            f"FROM {staging} s WHERE s.item_id IS NOT NULL;")
+        if table_name == "product_eligibility":
+            self.cursor.execute(f"INSERT OR IGNORE INTO eligibility_messages (message) SELECT DISTINCT s.message "
+                                f"FROM {staging} s WHERE s.message IS NOT NULL;")
+        encoded = f"temp.encoded_{table_name}"
+        self.cursor.execute(f"DROP TABLE IF EXISTS {encoded};")
+        self.cursor.execute(f"CREATE TEMP TABLE encoded_{table_name} ({ENCODED_COLUMNS[table_name]});")
+        self.cursor.execute(COMPACT_LOADS[table_name].format(staging=staging, target=encoded))
+        self.load_encoded(table_name, encoded)
+        self.cursor.execute(f"DROP TABLE {encoded};")
+
+    def load_encoded(self, table_name, source):
+        """
+        Bulk-load rows that are already in the compact encoding (the columns in
+        ENCODED_COLUMNS[table_name]) from `source`, a table of the connected
+        database such as a temp staging table. Sales rows go to their monthly
+        partitions, creating them (and rebuilding the views) as needed;
+        eligibility rows also update the current snapshot. Call it between
+        connect() and close(); the caller commits.
+        """
+        if table_name == "product_eligibility":
+            self.cursor.execute("INSERT INTO eligibility_fact (eligibility_ts, item_key, eligible, message_key) "
+                                f"SELECT eligibility_ts, item_key, eligible, message_key FROM {source};")
+            self.cursor.execute(UPDATE_CURRENT_ELIGIBILITY.format(source=source))
+        elif table_name in PARTITIONED_VIEWS:
+            self._distribute(PARTITIONED_VIEWS[table_name]["base_table"], source)
+        else:
+            raise ValueError(f"Unknown table '{table_name}'")
+
+    def _backfill_current_eligibility(self):
+        """Build eligibility_current from the full history if it has never been filled."""
+        self.cursor.execute("SELECT EXISTS (SELECT 1 FROM eligibility_current);")
+        if not self.cursor.fetchone()[0]:
+            self.cursor.execute(UPDATE_CURRENT_ELIGIBILITY.format(source="eligibility_fact"))
+
+    def _distribute(self, base_table, source):
+        """Copy encoded fact rows from source into their monthly partitions."""
+        self.cursor.execute(f"SELECT DISTINCT strftime('%Y-%m', day * 86400, 'unixepoch') FROM {source} ORDER BY 1;")
+        months = [row[0] for row in self.cursor.fetchall()]
+        created = False
+        for month in months:
+            table, new = self._ensure_partition(base_table, month)
+            created = created or new
+            first_day, last_day = month_bounds(month)
+            self.cursor.execute(f"INSERT INTO {table} SELECT * FROM {source} WHERE day BETWEEN ? AND ?;",
+                                (first_day, last_day))
+        if created:
+            self._rebuild_views()
+
+    def _ensure_partition(self, base_table, month):
+        """Return (qualified table name, created) for the partition holding a month."""
+        self.cursor.execute("SELECT table_name, archive_path FROM fact_partitions WHERE base_table = ? AND month = ?;",
+                            (base_table, month))
+        row = self.cursor.fetchone()
+        if row is not None:
+            table_name, archive_path = row
+            if archive_path:
+                # Late rows for an archived month go to its archive file
+                return f"{self._attach_archive(archive_path)}.{table_name}", False
+            return f"main.{table_name}", False
+        table_name = partition_table_name(base_table, month)
+        first_day, last_day = month_bounds(month)
+        self.cursor.execute(f"CREATE TABLE IF NOT EXISTS main.{table_name} ({FACT_COLUMNS[base_table]});")
+        self.cursor.execute(f"CREATE INDEX IF NOT EXISTS main.idx_{table_name}_day ON {table_name}(day, item_key);")
+        self.cursor.execute(f"CREATE INDEX IF NOT EXISTS main.idx_{table_name}_item ON {table_name}(item_key, day);")
+        self.cursor.execute("INSERT INTO fact_partitions (base_table, month, table_name, first_day, last_day) "
+                            "VALUES (?, ?, ?, ?, ?);", (base_table, month, table_name, first_day, last_day))
+        return f"main.{table_name}", True
+
+    def _archive_file(self, archive_path):
+        if os.path.isabs(archive_path):
+            return archive_path
+        return os.path.join(os.path.dirname(os.path.abspath(self.db_path)), archive_path)
+
+    def _attach_archive(self, archive_path):
+        schema = self._attached.get(archive_path)
+        if schema is None:
+            schema = archive_schema_name(archive_path)
+            self.cursor.execute(f"ATTACH DATABASE ? AS {schema};", (self._archive_file(archive_path),))
+            self._attached[archive_path] = schema
+        return schema
+
+    def _rebuild_views(self):
+        """
+        Recreate the compatibility views: the partitioned ones over the base
+        table and the live partitions, and the eligibility views.
+        """
+        partitions = load_catalog(self.cursor)
+        for view_name, spec in PARTITIONED_VIEWS.items():
+            tables = [spec["base_table"]] + [p.table_name for p in partitions
+                                             if p.base_table == spec["base_table"] and not p.archive_path]
+            self.cursor.execute(f"DROP VIEW IF EXISTS {view_name};")
+            self.cursor.execute(f"CREATE VIEW {view_name} AS {view_sql(view_name, tables)};")
+        for view_name, source_table in ELIGIBILITY_VIEWS.items():
+            self.cursor.execute(f"DROP VIEW IF EXISTS {view_name};")
+            self.cursor.execute(f"CREATE VIEW {view_name} AS {eligibility_view_sql(source_table)};")
+
+    def _upgrade_items(self):
+        """Give items.item_id INTEGER affinity in a database created before it had it."""
+        self.cursor.execute("SELECT type FROM pragma_table_info('items') WHERE name = 'item_id';")
+        row = self.cursor.fetchone()
+        if row is None or row[0].upper() == "INTEGER":
+            return
+        # The views read items; _rebuild_views recreates them
+        for view_name in list(PARTITIONED_VIEWS) + list(ELIGIBILITY_VIEWS):
+            self.cursor.execute(f"DROP VIEW IF EXISTS {view_name};")
+        self.cursor.execute(f"CREATE TABLE items_upgraded ({ITEMS_COLUMNS});")
+        self.cursor.execute("INSERT INTO items_upgraded (item_key, item_id) SELECT item_key, item_id FROM items;")
+        self.cursor.execute("DROP TABLE items;")
+        self.cursor.execute("ALTER TABLE items_upgraded RENAME TO items;")
+
+    def partition_existing_rows(self):
+        """Move rows still stored in the base fact tables into monthly partitions."""
+        self.connect()
+        try:
+            self.cursor.execute(CATALOG_DDL)
+            for spec in PARTITIONED_VIEWS.values():
+                base_table = spec["base_table"]
+                self._distribute(base_table, f"main.{base_table}")
+                self.cursor.execute(f"DELETE FROM main.{base_table};")
+            self._rebuild_views()
+            self.conn.commit()
+            self.cursor.execute("VACUUM;")
+            print("Moved fact rows into monthly partitions.")
+            return True
         except sqlite3.Error as e:
-            print(f"Error inserting data into {table_name}: {e}")
+            self.conn.rollback()
+            print(f"Error partitioning fact tables: {e}")
+            return False
+        finally:
+            self.close()
+
+    def list_partitions(self):
+        self.connect()
+        try:
+            return load_catalog(self.cursor)
         finally:
             self.close()
 
+    def archive_partition(self, base_table, month, archive_path=None):
+        """
+        Move one monthly partition out of the main database into an archive file
+        (by default <database>_partitions_<year>.db next to it, so databases in
+        one directory, such as shards, do not share one). Queries still see the rows
+        through DatabaseManager, which attaches the archive files; the other
+        partitions are not touched.
+        """
+        stem = os.path.splitext(os.path.basename(self.db_path))[0]
+        archive_path = archive_path or f"{stem}_partitions_{month[:4]}.db"
+        self.connect()
+        try:
+            self.cursor.execute("SELECT table_name, archive_path FROM fact_partitions WHERE base_table = ? AND month = ?;",
+                                (base_table, month))
+            row = self.cursor.fetchone()
+            if row is None or row[1]:
+                print(f"No live partition of {base_table} for {month}.")
+                return False
+            table_name = row[0]
+            schema = self._attach_archive(archive_path)
+            self.cursor.execute(f"CREATE TABLE {schema}.{table_name} ({FACT_COLUMNS[base_table]});")
+            self.cursor.execute(f"INSERT INTO {schema}.{table_name} SELECT * FROM main.{table_name};")
+            self.cursor.execute(f"CREATE INDEX {schema}.idx_{table_name}_day ON {table_name}(day, item_key);")
+            self.cursor.execute(f"CREATE INDEX {schema}.idx_{table_name}_item ON {table_name}(item_key, day);")
+            self.cursor.execute("UPDATE fact_partitions SET archive_path = ? WHERE table_name = ?;",
+                                (archive_path, table_name))
+            self.cursor.execute(f"DROP TABLE main.{table_name};")
+            self._rebuild_views()
+            self.conn.commit()
+            print(f"Archived {table_name} to {archive_path}.")
+            return True
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"Error archiving {base_table} {month}: {e}")
+            return False
+        finally:
+            self.close()
+
+    def archive_partitions_before(self, month, archive_path=None):
+        """Archive every live partition of a month earlier than 'YYYY-MM'."""
+        archived = 0
+        for partition in self.list_partitions():
+            if partition.month < month and not partition.archive_path:
+                archived += self.archive_partition(partition.base_table, partition.month, archive_path)
+        return archived
+
+    def insert_data(self, df, table_name):
+        try:
+            if self.layout == "compact":
+                columns = [str(column) for column in df.columns]
+                self.insert_rows(table_name, columns, df.astype(object).itertuples(index=False, name=None))
+            else:
+                self.connect()
+                try:
+                    df.to_sql(table_name, self.conn, if_exists="append", index=False)
+                    self.conn.commit()
+                finally:
+                    self.close()
+            print(f"Data inserted into {table_name} successfully.")
+        except sqlite3.Error as e:
+            print(f"Error inserting data into {table_name}: {e}")
+
     def process_excel_data(self, file_path, table_name):
         try:
+            import pandas as pd
             df = pd.read_excel(file_path)
             self.insert_data(df, table_name)
         except FileNotFoundError:
@@ -69,13 +439,66 @@ class DataIngestion:
         except Exception as e:
             print(f"Error processing Excel file {file_path}: {e}")
 
+    def migrate_to_compact(self):
+        """
+        Convert a database in the legacy layout (one wide TEXT-keyed table per
+        source file) to the compact layout in place, keeping every row.
+        """
+        if self.detect_layout() != "legacy":
+            print("Database is not in the legacy layout; nothing to migrate.")
+            return False
+        self.connect()
+        try:
+            self.cursor.execute("DROP VIEW IF EXISTS current_product_eligibility;")
+            for table_name in TABLE_COLUMNS:
+                self.cursor.execute(f"ALTER TABLE {table_name} RENAME TO legacy_{table_name};")
+            for statement in COMPACT_SCHEMA:
+                self.cursor.execute(statement)
+            self._rebuild_views()
+            for table_name in TABLE_COLUMNS:
+                self._encode_staged(table_name, f"legacy_{table_name}")
+                self.cursor.execute(f"DROP TABLE legacy_{table_name};")
+            self.conn.commit()
+            self.cursor.execute("VACUUM;")
+            print("Migrated database to the compact layout.")
+            return True
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"Error migrating database: {e}")
+            return False
+        finally:
+            self.close()
+
 if __name__ == "__main__":
-    data_ingestion = DataIngestion()
+    parser = argparse.ArgumentParser(description="Load the Excel exports into the SQLite database.")
+    parser.add_argument("--upload-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "upload"),
+                        help="Directory containing the three Excel files")
+    parser.add_argument("--layout", choices=LAYOUTS, default="compact", help="Storage layout for a new database")
+    parser.add_argument("--migrate", action="store_true",
+                        help="Convert an existing database to the compact, month-partitioned layout and exit")
+    parser.add_argument("--archive-before", metavar="YYYY-MM",
+                        help="Move the partitions of months before this one into per-year archive files and exit")
+    args = parser.parse_args()
+
+    data_ingestion = DataIngestion(layout=args.layout)
+    if args.migrate:
+        if data_ingestion.detect_layout() == "legacy" and not data_ingestion.migrate_to_compact():
+            sys.exit(1)
+        data_ingestion.create_tables()
+        sys.exit(0 if data_ingestion.partition_existing_rows() else 1)
+    if args.archive_before:
+        archived = data_ingestion.archive_partitions_before(args.archive_before)
+        print(f"Archived {archived} partition(s).")
+        sys.exit(0)
+
+    existing_layout = data_ingestion.detect_layout()
+    if existing_layout and existing_layout != args.layout:
+        print(f"Database already uses the {existing_layout} layout; appending in that layout.")
+        data_ingestion.layout = existing_layout
     data_ingestion.create_tables()
 
-    # Define paths to your Excel files using the absolute path you provided
-    base_dir = r"C:\Users\Siva K M\Downloads\e_commerce_ai_agent_final\upload"
-    
+    base_dir = args.upload_dir
+
     total_sales_file = os.path.join(base_dir, "Product-LevelTotalSalesandMetrics(mapped).xlsx")
     ad_sales_file = os.path.join(base_dir, "Product-LevelAdSalesandMetrics(mapped).xlsx")
     eligibility_file = os.path.join(base_dir, "Product-LevelEligibilityTable(mapped).xlsx")
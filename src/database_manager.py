@@ -1,56 +1,441 @@
 import sqlite3
 import os
+import logging
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from schema import DATETIME_FROM_MS_SQL
+from partitioning import PARTITIONED_VIEWS, PartitionRouter, archive_schema_name, load_catalog, view_sql
+from sql_rewriter import FanOutJoinRewriter, estimate_join_rows
+
+logger = logging.getLogger(__name__)
+
+# Only expressions of this form are evaluated when resolving date bounds for partition pruning
+_NOW_EXPRESSION_RE = re.compile(r"^date\(\s*'now'(?:\s*,\s*'[^']*')*\s*\)$", re.IGNORECASE)
+
+# String literals, quoted identifiers and comments, which validate_query ignores
+_SQL_QUOTED_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|\[[^\]]*\]|--[^\n]*|/\*.*?\*/", re.DOTALL)
+_DANGEROUS_SQL_RE = re.compile(r"\b(?:DROP|DELETE|UPDATE|INSERT|ALTER|CREATE|ATTACH|DETACH|PRAGMA|VACUUM)\b",
+                               re.IGNORECASE)
+
+STORAGE_CLASSES = ("integer", "real", "text", "blob")
+
+@contextmanager
+def query_only(conn):
+    """Refuse every write on the connection for the duration of the with-block."""
+    conn.execute("PRAGMA query_only = ON;")
+    try:
+        yield conn
+    finally:
+        conn.execute("PRAGMA query_only = OFF;")
+
+def scan_result_types(conn, query):
+    """
+    The SQLite storage classes found in each column of the query's complete
+    result, as one set per column (empty if the column is only NULL). Costs a
+    pass over the result, but not its memory.
+    """
+    cursor = conn.execute(query)
+    count = len(cursor.description or [])
+    cursor.close()
+    if not count:
+        return []
+    names = ", ".join(f"c{index}" for index in range(count))
+    checks = ", ".join(f"MAX(typeof(c{index}) = '{storage_class}')"
+                       for index in range(count) for storage_class in STORAGE_CLASSES)
+    row = conn.execute(f"WITH result({names}) AS ({query.strip().rstrip(';')}) SELECT {checks} FROM result;").fetchone()
+    width = len(STORAGE_CLASSES)
+    return [{storage_class for offset, storage_class in enumerate(STORAGE_CLASSES) if row[index * width + offset]}
+            for index in range(count)]
+
+class _PooledConnection(sqlite3.Connection):
+    """sqlite3 connection that can carry per-connection state set up by the pool."""
+
+    schema_version = None
+    partitions = ()
+
+class ConnectionPool:
+    """
+    Small thread-safe pool of SQLite connections owned by a single process.
+    Connections are opened lazily and are never shared across a fork: if the
+    pool is used from a different process than the one that filled it, the
+    inherited connections are discarded and new ones are opened.
+
+    setup(conn), if given, runs on each new connection and again whenever the
+    database schema has changed since it last ran on that connection.
+    """
+
+    def __init__(self, db_path, size=4, setup=None):
+        self.db_path = db_path
+        self.size = max(1, int(size))
+        self.setup = setup
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+
+    def _check_process(self):
+        if self._pid != os.getpid():
+            # Connections inherited from the parent must not be used (or closed) here.
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._idle = queue.LifoQueue()
+                    self._slots = threading.BoundedSemaphore(self.size)
+                    self._pid = os.getpid()
+
+    def _open(self):
+        return sqlite3.connect(self.db_path, check_same_thread=False, factory=_PooledConnection)
+
+    def _prepare(self, conn):
+        if self.setup is None:
+            return
+        schema_version = conn.execute("PRAGMA schema_version;").fetchone()[0]
+        if conn.schema_version != schema_version:
+            self.setup(conn)
+            conn.schema_version = schema_version
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of the with-block."""
+        self._check_process()
+        slots = self._slots
+        slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._open()
+            try:
+                self._prepare(conn)
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                self._idle.put(conn)
+        finally:
+            slots.release()
+
+    def close_all(self):
+        """Close every idle connection held by this process."""
+        self._check_process()
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
 
 class DatabaseManager:
-    def __init__(self, db_path="ecommerce_data.db"):
+    # How long row-count estimates for a rewrite are reused before being recomputed
+    ROW_ESTIMATE_TTL = 300
+    
+    def __init__(self, db_path="ecommerce_data.db", pool_size=4, rewrite_fan_out_joins=True):
         self.db_path = db_path
+        self.pool = ConnectionPool(db_path, size=pool_size, setup=self._setup_connection)
+        self.schema = None
+        self.rewriter = FanOutJoinRewriter() if rewrite_fan_out_joins else None
+        self._row_estimates = {}
+        self._estimating = set()
+        self._estimate_lock = threading.Lock()
+        
+    def _setup_connection(self, conn):
+        """
+        Load the partition catalog and attach the archive files holding archived
+        partitions. When some are archived, temporary views with the names of the
+        partitioned views cover every partition, live or archived.
+        """
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA database_list;")
+        for _, name, _ in cursor.fetchall():
+            if name.startswith("archive_"):
+                cursor.execute(f"DETACH DATABASE {name};")
+        partitions = load_catalog(cursor)
+        base_dir = os.path.dirname(os.path.abspath(self.db_path))
+        available = []
+        for partition in partitions:
+            if partition.archive_path:
+                archive_file = os.path.join(base_dir, partition.archive_path)
+                if not os.path.exists(archive_file):
+                    logger.warning(f"Archive {archive_file} for {partition.table_name} is missing; skipping it")
+                    continue
+                partition.schema = archive_schema_name(partition.archive_path)
+                cursor.execute("SELECT 1 FROM pragma_database_list WHERE name = ?;", (partition.schema,))
+                if cursor.fetchone() is None:
+                    cursor.execute(f"ATTACH DATABASE ? AS {partition.schema};", (archive_file,))
+            available.append(partition)
+        archived = any(p.archive_path for p in available)
+        for view_name, spec in PARTITIONED_VIEWS.items():
+            cursor.execute(f"DROP VIEW IF EXISTS temp.{view_name};")
+            if archived:
+                tables = [f"main.{spec['base_table']}"] + [p.qualified_name for p in available
+                                                          if p.base_table == spec["base_table"]]
+                cursor.execute(f"CREATE TEMP VIEW {view_name} AS "
+                               f"{view_sql(view_name, tables, items_table='main.items')};")
+        cursor.close()
+        conn.partitions = available
+    
+    def prune_partitions(self, query, conn):
+        """
+        Restrict date-filtered reads of the partitioned views to the monthly
+        partitions that can match. Returns the query and a pruning report (or None).
+        """
+        if not conn.partitions:
+            return query, None
+        
+        def evaluate(expression):
+            if not _NOW_EXPRESSION_RE.match(expression):
+                raise ValueError(f"Unsupported date expression: {expression}")
+            return conn.execute(f"SELECT {expression};").fetchone()[0]
+        
+        try:
+            return PartitionRouter(conn.partitions, evaluate).route(query)
+        except Exception as e:
+            logger.warning(f"Skipping partition pruning: {e}")
+            return query, None
+    
+    def rewrite_query(self, query, estimate_rows=True):
+        """
+        Run the pre-execution rewrite stage. Returns the query to execute and a
+        report of the rewrite (None if the query was left as is). With
+        estimate_rows the report carries the joined-row estimates, or None for
+        them while they are still being computed (see _row_estimate).
+        """
+        if self.rewriter is None:
+            return query, None
+        try:
+            rewrite = self.rewriter.rewrite(query)
+        except Exception as e:
+            logger.warning(f"Skipping query rewrite: {e}")
+            return query, None
+        if rewrite is None:
+            return query, None
         
+        report = rewrite.to_dict()
+        if estimate_rows:
+            before, after = self._row_estimate(rewrite) or (None, None)
+            report["estimated_join_rows_before"] = before
+            report["estimated_join_rows_after"] = after
+            report["row_reduction_factor"] = round(before / after, 2) if before is not None and after else None
+        logger.info(f"Rewrote fan-out join ({rewrite.strategy})")
+        return rewrite.rewritten_query, report
+    
+    def _row_estimate(self, rewrite):
+        """
+        The (before, after) joined-row estimates of a rewrite, or None if there
+        are none yet. estimate_join_rows scans both tables, so it runs in a
+        background thread on its own connection, never in the request; an
+        expired estimate is still returned while it is recomputed.
+        """
+        key = (rewrite.tables, rewrite.strategy)
+        with self._estimate_lock:
+            cached = self._row_estimates.get(key)
+            expired = cached is None or time.monotonic() - cached[0] > self.ROW_ESTIMATE_TTL
+            if expired and key not in self._estimating:
+                self._estimating.add(key)
+                threading.Thread(target=self._estimate_rows, args=(key, rewrite), name="row-estimate",
+                                 daemon=True).start()
+        return cached[1] if cached else None
+    
+    def _estimate_rows(self, key, rewrite):
+        try:
+            with self.dedicated_connection() as conn:
+                estimate = estimate_join_rows(conn.cursor(), rewrite)
+            with self._estimate_lock:
+                self._row_estimates[key] = (time.monotonic(), estimate)
+            logger.info(f"Fan-out join {rewrite.strategy} on {rewrite.tables}: "
+                        f"~{estimate[0]:,} joined rows -> ~{estimate[1]:,}")
+        except Exception as e:
+            logger.warning(f"Could not estimate joined rows: {e}")
+        finally:
+            with self._estimate_lock:
+                self._estimating.discard(key)
+    
+    @contextmanager
+    def dedicated_connection(self):
+        """
+        A connection of its own, set up like the pooled ones and closed after
+        the with-block, for work that must not hold one of the pool's
+        connections (which admitted requests wait for) for long.
+        """
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, factory=_PooledConnection)
+        try:
+            self._setup_connection(conn)
+            yield conn
+        finally:
+            conn.close()
+    
     def execute_query(self, query):
         """Execute a SQL query and return the results."""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute(query)
-            results = cursor.fetchall()
-            column_names = [description[0] for description in cursor.description]
-            conn.close()
-            return {"success": True, "data": results, "columns": column_names}
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                query, rewrite = self.rewrite_query(query)
+                query, pruning = self.prune_partitions(query, conn)
+                cursor.execute(query)
+                results = cursor.fetchall()
+                column_names = [description[0] for description in cursor.description]
+            result = {"success": True, "data": results, "columns": column_names}
+            if rewrite:
+                result["rewrite"] = rewrite
+            if pruning:
+                result["partition_pruning"] = pruning
+            return result
         except sqlite3.Error as e:
             return {"success": False, "error": str(e)}
         except Exception as e:
             return {"success": False, "error": f"Unexpected error: {str(e)}"}
     
+    def stream_query(self, query, chunk_size=5000, read_only=False):
+        """
+        Execute a SQL query and yield (columns, rows) one fetchmany() chunk at a
+        time, so memory stays bounded whatever the size of the result.
+        Errors are raised, not returned: the caller is streaming. With
+        read_only the query runs under PRAGMA query_only, for SQL from clients.
+        A stream can stay open as long as a client downloads, so it runs on a
+        dedicated connection rather than a pooled one.
+        """
+        with self.dedicated_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                query, _ = self.rewrite_query(query, estimate_rows=False)
+                query, _ = self.prune_partitions(query, conn)
+                if read_only:
+                    conn.execute("PRAGMA query_only = ON;")
+                cursor.execute(query)
+                columns = [description[0] for description in cursor.description or []]
+                empty = True
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    empty = False
+                    yield columns, rows
+                if empty:
+                    yield columns, []
+            finally:
+                cursor.close()
+    
+    def get_result_types(self, query, read_only=False):
+        """The storage classes in each column of the query's result (see scan_result_types)."""
+        with self.dedicated_connection() as conn:
+            query, _ = self.rewrite_query(query, estimate_rows=False)
+            query, _ = self.prune_partitions(query, conn)
+            if not read_only:
+                return scan_result_types(conn, query)
+            with query_only(conn):
+                return scan_result_types(conn, query)
+    
+    def get_eligibility_as_of(self, as_of=None, item_id=None):
+        """
+        Eligibility of every item (or of one item) as it stood at a point in
+        time, given as 'YYYY-MM-DD[ HH:MM:SS]' in UTC. Without as_of the
+        maintained current snapshot is returned. Each item costs one seek on
+        the (item_key, eligibility_ts) index, never a scan of the full history.
+        """
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT name FROM sqlite_master WHERE name = 'eligibility_fact';")
+                compact = cursor.fetchone() is not None
+                if as_of is None:
+                    query = "SELECT * FROM current_product_eligibility" + (" WHERE item_id = ?" if item_id else "")
+                    params = [item_id] if item_id else []
+                elif compact:
+                    cursor.execute("SELECT CAST(ROUND((julianday(?) - 2440587.5) * 86400000) AS INTEGER);", (as_of,))
+                    as_of_ms = cursor.fetchone()[0]
+                    if as_of_ms is None:
+                        return {"success": False, "error": f"Invalid as_of timestamp: {as_of}"}
+                    query = f"""SELECT {DATETIME_FROM_MS_SQL} AS eligibility_datetime_utc, i.item_id AS item_id,
+                                      f.eligible AS eligibility, m.message AS message
+                               FROM items i
+                               JOIN eligibility_fact f ON f.rowid = (
+                                   SELECT h.rowid FROM eligibility_fact h
+                                   WHERE h.item_key = i.item_key AND h.eligibility_ts <= ?
+                                   ORDER BY h.eligibility_ts DESC LIMIT 1)
+                               LEFT JOIN eligibility_messages m ON m.message_key = f.message_key"""
+                    params = [as_of_ms]
+                    if item_id:
+                        query += " WHERE i.item_id = ?"
+                        params.append(item_id)
+                else:
+                    # One seek per item on the (item_id, eligibility_datetime_utc) index
+                    query = """SELECT p.* FROM (SELECT DISTINCT item_id FROM product_eligibility) i
+                               JOIN product_eligibility p ON p.rowid = (
+                                   SELECT h.rowid FROM product_eligibility h
+                                   WHERE h.item_id = i.item_id AND h.eligibility_datetime_utc <= ?
+                                   ORDER BY h.eligibility_datetime_utc DESC LIMIT 1)"""
+                    params = [as_of]
+                    if item_id:
+                        query += " WHERE i.item_id = ?"
+                        params.append(item_id)
+                cursor.execute(query, params)
+                results = cursor.fetchall()
+                column_names = [description[0] for description in cursor.description]
+            return {"success": True, "data": results, "columns": column_names}
+        except sqlite3.Error as e:
+            return {"success": False, "error": str(e)}
+    
+    def get_data_version(self):
+        """
+        Identifier that changes whenever ingestion loads new data: the
+        data_version counter, or the file's modification time and size for a
+        database that predates it.
+        """
+        try:
+            with self.pool.connection() as conn:
+                row = conn.execute("SELECT version FROM data_version WHERE id = 1;").fetchone()
+            if row is not None:
+                return f"v{row[0]}"
+        except sqlite3.OperationalError:
+            pass
+        stat = os.stat(self.db_path)
+        return f"m{stat.st_mtime_ns}-{stat.st_size}"
+    
     def get_table_info(self):
         """Get information about all tables in the database."""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Get all table names
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-            tables = cursor.fetchall()
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                
+                # Get all table and view names (the compact layout exposes its data through views)
+                cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view');")
+                tables = cursor.fetchall()
+                
+                table_info = {}
+                for table in tables:
+                    table_name = table[0]
+                    cursor.execute(f"PRAGMA table_info({table_name});")
+                    columns = cursor.fetchall()
+                    table_info[table_name] = columns
             
-            table_info = {}
-            for table in tables:
-                table_name = table[0]
-                cursor.execute(f"PRAGMA table_info({table_name});")
-                columns = cursor.fetchall()
-                table_info[table_name] = columns
-            
-            conn.close()
             return {"success": True, "tables": table_info}
         except sqlite3.Error as e:
             return {"success": False, "error": str(e)}
     
+    def warm_up(self):
+        """Open a pooled connection and load the schema before the first question."""
+        table_info = self.get_table_info()
+        if not table_info["success"]:
+            raise RuntimeError(table_info["error"])
+        self.schema = table_info["tables"]
+        return self.schema
+    
+    def reset_pool(self):
+        """Drop all pooled connections, e.g. in a freshly forked worker."""
+        self.pool.close_all()
+        # Estimates being computed by a parent's thread never finish here
+        self._estimating = set()
+        self._estimate_lock = threading.Lock()
+    
     def validate_query(self, query):
-        """Basic validation to prevent dangerous SQL operations."""
-        dangerous_keywords = ["DROP", "DELETE", "UPDATE", "INSERT", "ALTER", "CREATE"]
-        query_upper = query.upper()
-        
-        for keyword in dangerous_keywords:
-            if keyword in query_upper:
-                return False
-        return True
+        """
+        Basic validation to prevent dangerous SQL operations. Keywords are
+        matched as whole words outside string literals, quoted identifiers and
+        comments, so e.g. a last_updated column or a 'deleted' value is fine.
+        """
+        return not _DANGEROUS_SQL_RE.search(_SQL_QUOTED_RE.sub(" ", query))
 
 if __name__ == "__main__":
     # Test the database manager
@@ -0,0 +1,170 @@
+import csv
+import io
+import json
+import zlib
+
+EXPORT_FORMATS = {
+    "csv": {"extension": "csv", "mimetype": "text/csv"},
+    "jsonl": {"extension": "jsonl", "mimetype": "application/x-ndjson"},
+    "parquet": {"extension": "parquet", "mimetype": "application/vnd.apache.parquet"},
+}
+
+class ExportError(Exception):
+    """Raised when an export cannot be produced in the requested format."""
+
+def csv_chunks(columns, row_chunks):
+    """Encode row chunks as CSV, one bytes object per chunk, header first."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in row_chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+def jsonl_chunks(columns, row_chunks):
+    """Encode row chunks as JSON lines, one object per row."""
+    for rows in row_chunks:
+        if not rows:
+            continue
+        lines = [json.dumps(dict(zip(columns, row)), default=str) for row in rows]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands out whatever was written since the last drain."""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+def _arrow_type(pa, storage_classes):
+    """Arrow type for a column holding values of the given SQLite storage classes."""
+    if not storage_classes:
+        return pa.null()
+    if storage_classes == {"integer"}:
+        return pa.int64()
+    if storage_classes <= {"integer", "real"}:
+        return pa.float64()
+    if storage_classes == {"blob"}:
+        return pa.binary()
+    return pa.string()
+
+def _storage_classes(values):
+    classes = set()
+    for value in values:
+        if isinstance(value, int):
+            classes.add("integer")
+        elif isinstance(value, float):
+            classes.add("real")
+        elif isinstance(value, bytes):
+            classes.add("blob")
+        elif value is not None:
+            classes.add("text")
+    return classes
+
+def _arrow_values(pa, name, values, arrow_type):
+    """Values converted for the column's Arrow type; anything that would lose data raises ExportError."""
+    if arrow_type == pa.string():
+        return [None if value is None else str(value) for value in values]
+    allowed = {pa.int64(): {"integer"}, pa.float64(): {"integer", "real"}, pa.binary(): {"blob"}}.get(arrow_type, set())
+    if not _storage_classes(values) <= allowed:
+        raise ExportError(f"Column '{name}' changes type within the result and cannot be written as {arrow_type}")
+    if arrow_type == pa.float64():
+        return [None if value is None else float(value) for value in values]
+    return values
+
+def parquet_chunks(columns, row_chunks, compression="snappy", column_types=None):
+    """
+    Encode row chunks as a Parquet file, one row group per chunk; pyarrow is
+    required. column_types gives the SQLite storage classes of each column
+    over the whole result (see DatabaseManager.get_result_types); without it
+    the types of the first chunk are used, and a later value of another type
+    raises ExportError rather than being converted.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError("Parquet export requires the pyarrow package")
+
+    sink = _ChunkSink()
+    writer = None
+    schema = None
+    if column_types is not None:
+        schema = pa.schema([(name, _arrow_type(pa, classes)) for name, classes in zip(columns, column_types)])
+    try:
+        for rows in row_chunks:
+            column_values = [list(values) for values in zip(*rows)] if rows else [[] for _ in columns]
+            if schema is None:
+                schema = pa.schema([(name, _arrow_type(pa, _storage_classes(values)))
+                                    for name, values in zip(columns, column_values)])
+            if writer is None:
+                writer = pq.ParquetWriter(sink, schema, compression=compression)
+            arrays = [pa.array(_arrow_values(pa, field.name, values, field.type), type=field.type)
+                      for values, field in zip(column_values, schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            data = sink.drain()
+            if data:
+                yield data
+        if writer is None:
+            schema = schema or pa.schema([(name, pa.string()) for name in columns])
+            writer = pq.ParquetWriter(sink, schema, compression=compression)
+        writer.close()
+        writer = None
+        yield sink.drain()
+    finally:
+        if writer is not None:
+            writer.close()
+
+def gzip_chunks(byte_chunks, level=6):
+    """Compress a stream of bytes into a single gzip member, chunk by chunk."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in byte_chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def encode_export(export_format, columns, row_chunks, gzip=False, column_types=None):
+    """
+    Return (byte_chunks, mimetype, filename_extension) for an export.
+    Parquet is compressed internally, so gzip there selects the gzip codec
+    instead of wrapping the file; column_types fixes its schema (see
+    parquet_chunks).
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ExportError(f"Unsupported export format '{export_format}'. Use one of: {', '.join(EXPORT_FORMATS)}")
+    spec = EXPORT_FORMATS[export_format]
+    if export_format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ExportError("Parquet export requires the pyarrow package")
+        chunks = parquet_chunks(columns, row_chunks, compression="gzip" if gzip else "snappy",
+                                column_types=column_types)
+        return chunks, spec["mimetype"], spec["extension"]
+    encoder = csv_chunks if export_format == "csv" else jsonl_chunks
+    chunks = encoder(columns, row_chunks)
+    if gzip:
+        return gzip_chunks(chunks), "application/gzip", spec["extension"] + ".gz"
+    return chunks, spec["mimetype"], spec["extension"]
@@ -31,9 +31,9 @@ class FallbackQuerySystem:
             r'(?i).*impressions.*product.*': "SELECT item_id, SUM(impressions) as total_impressions FROM ad_sales_metrics GROUP BY item_id ORDER BY total_impressions DESC LIMIT 10;",
             
             # Eligibility queries
-            r'(?i).*not\s+eligible.*': "SELECT item_id, message FROM product_eligibility WHERE eligibility = 0;",
-            r'(?i).*eligible.*products.*': "SELECT item_id FROM product_eligibility WHERE eligibility = 1;",
-            r'(?i).*eligibility.*status.*': "SELECT eligibility, COUNT(*) as count FROM product_eligibility GROUP BY eligibility;",
+            r'(?i).*not\s+eligible.*': "SELECT item_id, message FROM current_product_eligibility WHERE eligibility = 0;",
+            r'(?i).*eligible.*products.*': "SELECT item_id FROM current_product_eligibility WHERE eligibility = 1;",
+            r'(?i).*eligibility.*status.*': "SELECT eligibility, COUNT(*) as count FROM current_product_eligibility GROUP BY eligibility;",
             
             # Ad spend queries
             r'(?i).*total.*ad.*spend.*': "SELECT SUM(ad_spend) as total_ad_spend FROM ad_sales_metrics;",
@@ -54,8 +54,8 @@ class FallbackQuerySystem:
             r'(?i).*number\s+of\s+products.*': "SELECT COUNT(DISTINCT item_id) as product_count FROM total_sales_metrics;",
             
             # Date range queries
-            r'(?i).*sales.*today.*': "SELECT SUM(total_sales) as today_sales FROM total_sales_metrics WHERE date = date('now');",
-            r'(?i).*sales.*yesterday.*': "SELECT SUM(total_sales) as yesterday_sales FROM total_sales_metrics WHERE date = date('now', '-1 day');",
+            r'(?i).*sales.*today.*': "SELECT SUM(total_sales) as today_sales FROM total_sales_metrics WHERE date >= date('now') AND date < date('now', '+1 day');",
+            r'(?i).*sales.*yesterday.*': "SELECT SUM(total_sales) as yesterday_sales FROM total_sales_metrics WHERE date >= date('now', '-1 day') AND date < date('now');",
             
             # Performance metrics
             r'(?i).*conversion.*rate.*': "SELECT (SUM(units_sold) * 100.0 / SUM(clicks)) as conversion_rate FROM ad_sales_metrics WHERE clicks > 0;",
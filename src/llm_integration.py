@@ -1,15 +1,68 @@
-import ollama
 import json
 import logging
+import threading
+import time
+from collections import OrderedDict
 
 logger = logging.getLogger(__name__)
 
 class LLMIntegration:
-    def __init__(self, model="mistral", base_url="http://localhost:11434" ):
+    def __init__(self, model="mistral", base_url="http://localhost:11434", cache_size=256, cache_ttl=3600):
         self.model = model
         self.base_url = base_url
-        self.client = ollama.Client(host=self.base_url)
+        self._client = None
         self.system_prompt = self._get_system_prompt()
+        # Generation runs at temperature 0, so the SQL for a question can be reused, for
+        # cache_ttl seconds so that a bad generation is not served forever (0 disables the cache)
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    @property
+    def client(self):
+        # Created on first use so that a process forked after __init__ opens its own HTTP session
+        if self._client is None:
+            import ollama
+            self._client = ollama.Client(host=self.base_url)
+        return self._client
+
+    def reset_client(self):
+        """Forget the current model client; the next call builds a fresh one."""
+        self._client = None
+
+    @staticmethod
+    def _cache_key(question):
+        return " ".join(question.lower().split())
+
+    def get_cached_query(self, question):
+        """Return the SQL generated for this question within the last cache_ttl seconds, or None."""
+        key = self._cache_key(question)
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            stored_at, sql_query = entry
+            if time.monotonic() - stored_at > self.cache_ttl:
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return sql_query
+
+    def _store_cached_query(self, question, sql_query):
+        if self.cache_ttl <= 0:
+            return
+        key = self._cache_key(question)
+        with self._cache_lock:
+            self._cache[key] = (time.monotonic(), sql_query)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def clear_cache(self):
+        """Forget all generated SQL, e.g. after the prompt or the schema changed."""
+        with self._cache_lock:
+            self._cache.clear()
 
     def _get_system_prompt(self):
         # Define your database schema clearly for the LLM
@@ -20,19 +73,22 @@ class LLMIntegration:
 
         Database Schema:
         Table: total_sales_metrics
-        Columns: date (TEXT), item_id (TEXT), total_sales (REAL), total_units_ordered (INTEGER)
+        Columns: date (TEXT), item_id (INTEGER), total_sales (REAL), total_units_ordered (INTEGER)
 
         Table: ad_sales_metrics
-        Columns: date (TEXT), item_id (TEXT), ad_sales (REAL), impressions (INTEGER), ad_spend (REAL), clicks (INTEGER), units_sold (INTEGER)
+        Columns: date (TEXT), item_id (INTEGER), ad_sales (REAL), impressions (INTEGER), ad_spend (REAL), clicks (INTEGER), units_sold (INTEGER)
 
         Table: product_eligibility
-        Columns: eligibility_datetime_utc (TEXT), item_id (TEXT), eligibility (TEXT), message (TEXT)
+        Columns: eligibility_datetime_utc (TEXT), item_id (INTEGER), eligibility (INTEGER, 1 = eligible, 0 = not eligible), message (TEXT)
+
+        Table: current_product_eligibility
+        Columns: same as product_eligibility; one row per item_id holding its latest eligibility record
 
         Instructions:
         - Only generate SQL queries. Do NOT include any explanations, comments, or additional text.
         - Use standard SQL functions (SUM, AVG, COUNT, MAX, MIN, GROUP BY, ORDER BY, WHERE, JOIN).
         - Ensure column names and table names exactly match the schema.
-        - For questions involving dates, assume dates are in 'YYYY-MM-DD' format and use appropriate SQLite date functions if needed (e.g., strftime).
+        - For questions involving dates, note that date is stored as 'YYYY-MM-DD 00:00:00'. Select days with ranges such as date >= '2025-06-01' AND date < '2025-06-08', or with date(date) = '2025-06-05', and use SQLite date functions if needed (e.g., strftime).
         - When asked for 'total units sold' or 'units sold', use the 'units_sold' column from the 'ad_sales_metrics' table.
         - When asked for 'total units ordered', use the 'total_units_ordered' column from the 'total_sales_metrics' table.
         - For RoAS (Return on Ad Spend), calculate it as (ad_sales / ad_spend) * 100. Ensure ad_spend is not zero to avoid division by zero errors.
@@ -40,6 +96,7 @@ class LLMIntegration:
         - When asked for 'least', use ORDER BY ASC LIMIT 1.
         - If a question asks for a percentage, calculate it using appropriate columns.
         - Always consider the most appropriate table for the requested data.
+        - For questions about which products are (or are not) eligible now, use 'current_product_eligibility'. Use 'product_eligibility' only for eligibility history or changes over time.
         - If a query requires data from both 'total_sales_metrics' and 'ad_sales_metrics' for the same item_id, use an INNER JOIN on item_id.
 
         Examples:
@@ -67,27 +124,45 @@ class LLMIntegration:
         User: Calculate the RoAS for each item.
         SQL: SELECT t1.item_id, (SUM(t2.ad_sales) * 100.0 / SUM(t2.ad_spend)) AS RoAS FROM total_sales_metrics t1 INNER JOIN ad_sales_metrics t2 ON t1.item_id = t2.item_id WHERE t2.ad_spend > 0 GROUP BY t1.item_id;
 
+        User: Which products are not eligible for advertising?
+        SQL: SELECT item_id, message FROM current_product_eligibility WHERE eligibility = 0;
+
         User: Show top 10 products by RoAS.
         SQL: SELECT t1.item_id, (SUM(t2.ad_sales) * 100.0 / SUM(t2.ad_spend)) AS RoAS FROM total_sales_metrics t1 INNER JOIN ad_sales_metrics t2 ON t1.item_id = t2.item_id WHERE t2.ad_spend > 0 GROUP BY t1.item_id ORDER BY RoAS DESC LIMIT 10;
         """
         return schema_info
 
+    def warm_up(self, keep_alive="30m"):
+        """Ask the Ollama server to load the model into memory ahead of the first question."""
+        # An empty prompt only loads the model; no tokens are generated
+        self.client.generate(model=self.model, prompt="", keep_alive=keep_alive)
+
     def generate_sql_query(self, question):
+        cached = self.get_cached_query(question)
+        if cached is not None:
+            return cached
+
         messages = [
             {"role": "system", "content": self.system_prompt},
             {"role": "user", "content": question}
         ]
         
         try:
+            # Imported here so that a process without ollama still answers through the fallback system
+            import ollama
             response = self.client.chat(model=self.model, messages=messages, options={"temperature": 0.0})
             sql_query = response["message"]["content"]
             
             # Basic validation: ensure it starts with SELECT, INSERT, UPDATE, DELETE
             if sql_query.strip().upper().startswith(("SELECT", "INSERT", "UPDATE", "DELETE")):
+                self._store_cached_query(question, sql_query.strip())
                 return sql_query.strip()
             else:
                 logger.warning(f"LLM generated non-SQL response: {sql_query}")
                 return None
+        except ImportError as e:
+            logger.warning(f"LLM unavailable: {e}")
+            return None
         except ollama.ResponseError as e:
             logger.error(f"Ollama API error: {e}")
             return None
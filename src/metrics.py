@@ -0,0 +1,188 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = [(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+               for name, value in pairs]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    type_name = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in items]
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    type_name = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            state["counts"][index] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, {"counts": list(state["counts"]), "sum": state["sum"], "count": state["count"]})
+                           for key, state in self._values.items())
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state["counts"]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(float(bound))))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+class MetricsRegistry:
+    """Collection of metrics rendered together in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get_or_create(self, cls, name, help_text, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.type_name}")
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+class AgentMetrics:
+    """
+    The metrics exported by the agent: per-stage latency of the /ask pipeline,
+    per-route request counts and latency, pipeline errors and cache lookups.
+    Values are kept per process; with several workers each one reports its own.
+    """
+
+    def __init__(self, registry=None):
+        self.registry = registry or MetricsRegistry()
+        self.stage_seconds = self.registry.histogram(
+            "ask_stage_duration_seconds", "Time spent in each stage of the /ask pipeline.", ["stage"])
+        self.request_seconds = self.registry.histogram(
+            "http_request_duration_seconds", "HTTP request latency by route.", ["route"])
+        self.requests = self.registry.counter(
+            "http_requests_total", "HTTP requests by route, method and status.", ["route", "method", "status"])
+        self.errors = self.registry.counter(
+            "ask_errors_total", "Failures in the /ask pipeline by stage.", ["stage"])
+        self.cache_requests = self.registry.counter(
+            "cache_requests_total", "Cache lookups by cache and result (hit or miss).", ["cache", "result"])
+        self.admission = self.registry.counter(
+            "admission_decisions_total",
+            "Admission control decisions by stage (rejected, bypassed or skipped).", ["stage", "decision"])
+
+    @contextmanager
+    def stage(self, name, timings=None):
+        """
+        Time one pipeline stage. The duration goes to the stage histogram and,
+        when a timings list is given, is appended to it as (name, seconds).
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.errors.inc(stage=name)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stage_seconds.observe(elapsed, stage=name)
+            if timings is not None:
+                timings.append((name, elapsed))
+
+    def record_error(self, stage):
+        self.errors.inc(stage=stage)
+
+    def record_cache(self, cache, hit):
+        self.cache_requests.inc(cache=cache, result="hit" if hit else "miss")
+
+    def record_admission(self, stage, decision):
+        self.admission.inc(stage=stage, decision=decision)
+
+    def record_request(self, route, method, status, seconds):
+        self.requests.inc(route=route, method=method, status=str(status))
+        self.request_seconds.observe(seconds, route=route)
+
+    def render(self):
+        return self.registry.render()
+
+def server_timing_header(timings, total=None):
+    """Build a Server-Timing header value from (stage, seconds) pairs."""
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
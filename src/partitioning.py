@@ -0,0 +1,253 @@
+import re
+from datetime import date, timedelta
+
+from sql_rewriter import _depths, _mask_literals, split_clauses, split_conjuncts
+
+# Fact tables split into one table per calendar month. The compatibility view
+# reads the base table (rows stored before partitioning) plus every partition.
+PARTITIONED_VIEWS = {
+    "total_sales_metrics": {
+        "base_table": "total_sales_fact",
+        "columns": "f.total_sales AS total_sales, f.total_units_ordered AS total_units_ordered",
+    },
+    "ad_sales_metrics": {
+        "base_table": "ad_sales_fact",
+        "columns": ("f.ad_sales AS ad_sales, f.impressions AS impressions, f.ad_spend AS ad_spend, "
+                    "f.clicks AS clicks, f.units_sold AS units_sold"),
+    },
+}
+
+FACT_COLUMNS = {
+    "total_sales_fact": """day INTEGER NOT NULL,
+        item_key INTEGER NOT NULL REFERENCES items(item_key),
+        total_sales REAL,
+        total_units_ordered INTEGER""",
+    "ad_sales_fact": """day INTEGER NOT NULL,
+        item_key INTEGER NOT NULL REFERENCES items(item_key),
+        ad_sales REAL,
+        impressions INTEGER,
+        ad_spend REAL,
+        clicks INTEGER,
+        units_sold INTEGER""",
+}
+
+CATALOG_DDL = """CREATE TABLE IF NOT EXISTS fact_partitions (
+        base_table TEXT NOT NULL,
+        month TEXT NOT NULL,
+        table_name TEXT NOT NULL UNIQUE,
+        first_day INTEGER NOT NULL,
+        last_day INTEGER NOT NULL,
+        archive_path TEXT,
+        PRIMARY KEY (base_table, month)
+    );"""
+
+EPOCH = date(1970, 1, 1)
+
+_LITERAL = r"(?:'[^']*'|date\(\s*'now'(?:\s*,\s*'[^']*')*\s*\))"
+_COMPARISON_RE = re.compile(rf"^\s*(?:([A-Za-z_]\w*)\.)?date\s*(=|>=|<=|>|<)\s*({_LITERAL})\s*$", re.IGNORECASE)
+_BETWEEN_RE = re.compile(
+    rf"^\s*(?:([A-Za-z_]\w*)\.)?date\s+BETWEEN\s+({_LITERAL})\s+AND\s+({_LITERAL})\s*$", re.IGNORECASE)
+_PERIOD_RE = re.compile(
+    r"^\s*strftime\(\s*'(%Y-%m|%Y)'\s*,\s*(?:([A-Za-z_]\w*)\.)?date\s*\)\s*=\s*'(\d{4}(?:-\d{2})?)'\s*$",
+    re.IGNORECASE)
+# date(date) selects the same days as date itself
+_DAY_OF_DATE_RE = re.compile(r"^\s*date\(\s*((?:[A-Za-z_]\w*\.)?date)\s*\)", re.IGNORECASE)
+# Dates compare as text, so only literals in the stored 'YYYY-MM-DD...' form order like days
+_ISO_DAY_RE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+_TABLE_REFERENCE_RE = re.compile(
+    r"\b(FROM|JOIN)\s+(" + "|".join(PARTITIONED_VIEWS) + r")\b"
+    r"(?:\s+(?:AS\s+)?(?!(?:WHERE|JOIN|INNER|LEFT|CROSS|ON|GROUP|ORDER|LIMIT|HAVING|UNION)\b)([A-Za-z_]\w*))?",
+    re.IGNORECASE)
+
+def day_number(value):
+    """Days since 1970-01-01 for a date or a 'YYYY-MM-DD...' string (ValueError for any other string)."""
+    if isinstance(value, str):
+        if not _ISO_DAY_RE.match(value):
+            raise ValueError(f"Not a 'YYYY-MM-DD' date: {value!r}")
+        value = date.fromisoformat(value[:10])
+    return (value - EPOCH).days
+
+def month_bounds(month):
+    """First and last day number of a 'YYYY-MM' month."""
+    first = date.fromisoformat(f"{month}-01")
+    following = date(first.year + first.month // 12, first.month % 12 + 1, 1)
+    return day_number(first), day_number(following - timedelta(days=1))
+
+def partition_table_name(base_table, month):
+    return f"{base_table}_{month.replace('-', '')}"
+
+def view_branch(view_name, table, day_range=None, items_table="items"):
+    """One SELECT of a partitioned view, reading `table` in the view's column format."""
+    where = ""
+    if day_range is not None:
+        low, high = day_range
+        conditions = []
+        if low is not None:
+            conditions.append(f"f.day >= {int(low)}")
+        if high is not None:
+            conditions.append(f"f.day <= {int(high)}")
+        if conditions:
+            where = " WHERE " + " AND ".join(conditions)
+    # Dates read back in the original '2025-06-01 00:00:00' format
+    return (f"SELECT strftime('%Y-%m-%d 00:00:00', f.day * 86400, 'unixepoch') AS date, i.item_id AS item_id, "
+            f"{PARTITIONED_VIEWS[view_name]['columns']} "
+            f"FROM {table} f JOIN {items_table} i ON i.item_key = f.item_key{where}")
+
+def view_sql(view_name, tables, day_range=None, items_table="items"):
+    return " UNION ALL ".join(view_branch(view_name, table, day_range, items_table) for table in tables)
+
+class Partition:
+    """One row of the fact_partitions catalog."""
+
+    def __init__(self, base_table, month, table_name, first_day, last_day, archive_path=None, schema="main"):
+        self.base_table = base_table
+        self.month = month
+        self.table_name = table_name
+        self.first_day = first_day
+        self.last_day = last_day
+        self.archive_path = archive_path
+        self.schema = schema
+
+    @property
+    def qualified_name(self):
+        return f"{self.schema}.{self.table_name}"
+
+    def overlaps(self, low, high):
+        return (high is None or self.first_day <= high) and (low is None or self.last_day >= low)
+
+def load_catalog(cursor):
+    """Read the partition catalog; an empty list if the database is not partitioned."""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'fact_partitions';")
+    if cursor.fetchone() is None:
+        return []
+    cursor.execute("SELECT base_table, month, table_name, first_day, last_day, archive_path "
+                   "FROM fact_partitions ORDER BY base_table, month;")
+    return [Partition(*row) for row in cursor.fetchall()]
+
+def archive_schema_name(archive_path):
+    stem = re.sub(r"\W", "_", re.sub(r"\.db$", "", archive_path.replace("\\", "/").rsplit("/", 1)[-1]))
+    return f"archive_{stem}"
+
+class PartitionRouter:
+    """
+    Rewrites references to the partitioned views so that a SELECT scope
+    filtered on date only reads the monthly partitions that can hold
+    matching rows, with the day range applied to the indexed day column.
+    Recognised filters are top-level WHERE conditions of the form
+    date = / < / <= / > / >= X, date BETWEEN X AND Y (also with date(date) in
+    place of date) and strftime('%Y-%m' or '%Y', date) = '...', where X is a
+    'YYYY-MM-DD...' string literal or date('now', ...); other literal forms
+    (e.g. '20260930') compare differently as text and are not used for
+    pruning. References without such a filter are left alone; the view
+    computes date for every row, so any other date filter scans them.
+    """
+
+    def __init__(self, partitions, evaluate):
+        # evaluate(sql_expression) -> value; used for date('now', ...) bounds
+        self.partitions = partitions
+        self.evaluate = evaluate
+
+    def route(self, query):
+        """Return (query, report); report lists the partitions kept per reference, or is None."""
+        if not self.partitions:
+            return query, None
+        masked = _mask_literals(query)
+        depths = _depths(masked)
+        replacements = []
+        report = []
+        for match in _TABLE_REFERENCE_RE.finditer(masked):
+            view_name = match.group(2).lower()
+            alias = match.group(3)
+            scope = self._enclosing_scope(masked, depths, match.start())
+            day_range = self._day_range(query[scope[0]:scope[1]], view_name, alias)
+            if day_range is None:
+                continue
+            low, high = day_range
+            base_table = PARTITIONED_VIEWS[view_name]["base_table"]
+            kept = [p for p in self.partitions if p.base_table == base_table and p.overlaps(low, high)]
+            total = sum(1 for p in self.partitions if p.base_table == base_table)
+            tables = [f"main.{base_table}"] + [p.qualified_name for p in kept]
+            derived = f"({view_sql(view_name, tables, day_range, items_table='main.items')}) {alias or view_name}"
+            replacements.append((match.start(2), match.end(), derived))
+            report.append({
+                "view": view_name,
+                "day_range": [low, high],
+                "partitions_scanned": [p.table_name for p in kept],
+                "partitions_total": total,
+            })
+        if not replacements:
+            return query, None
+        for start, end, text in sorted(replacements, reverse=True):
+            query = query[:start] + text + query[end:]
+        return query, report
+
+    @staticmethod
+    def _enclosing_scope(masked, depths, position):
+        depth = depths[position]
+        if depth == 0:
+            return 0, len(masked)
+        start = position
+        while start > 0 and not (masked[start - 1] == "(" and depths[start - 1] == depth):
+            start -= 1
+        end = position
+        while end < len(masked) and not (masked[end] == ")" and depths[end] == depth):
+            end += 1
+        return start, end
+
+    def _day_range(self, scope_sql, view_name, alias):
+        clauses = split_clauses(scope_sql)
+        if clauses is None or "WHERE" not in clauses:
+            return None
+        single_table = not re.search(r"\bJOIN\b|,", _mask_literals(clauses.get("FROM", "")), re.IGNORECASE)
+        qualifiers = {(alias or view_name).lower()}
+        low, high = None, None
+        found = False
+        for conjunct in split_conjuncts(clauses["WHERE"]):
+            bounds = self._bounds(conjunct, qualifiers, single_table)
+            if bounds is None:
+                continue
+            found = True
+            if bounds[0] is not None:
+                low = bounds[0] if low is None else max(low, bounds[0])
+            if bounds[1] is not None:
+                high = bounds[1] if high is None else min(high, bounds[1])
+        return (low, high) if found else None
+
+    def _bounds(self, conjunct, qualifiers, single_table):
+        def applies(qualifier):
+            return qualifier.lower() in qualifiers if qualifier else single_table
+
+        conjunct = _DAY_OF_DATE_RE.sub(r"\1", conjunct, count=1)
+        match = _COMPARISON_RE.match(conjunct)
+        if match and applies(match.group(1)):
+            day = self._literal_day(match.group(3))
+            if day is None:
+                return None
+            operator = match.group(2)
+            if operator == "=":
+                return day, day
+            # Bounds may be loose (> is treated as >=); the original filter still applies
+            return (day, None) if operator in (">", ">=") else (None, day)
+        match = _BETWEEN_RE.match(conjunct)
+        if match and applies(match.group(1)):
+            low, high = self._literal_day(match.group(2)), self._literal_day(match.group(3))
+            if low is None or high is None:
+                return None
+            return low, high
+        match = _PERIOD_RE.match(conjunct)
+        if match and applies(match.group(2)):
+            period = match.group(3)
+            if match.group(1) == "%Y-%m" and len(period) == 7:
+                return month_bounds(period)
+            if match.group(1) == "%Y" and len(period) == 4:
+                return month_bounds(f"{period}-01")[0], month_bounds(f"{period}-12")[1]
+        return None
+
+    def _literal_day(self, literal):
+        try:
+            if literal.startswith("'"):
+                return day_number(literal.strip("'"))
+            value = self.evaluate(literal)
+            return day_number(value) if value else None
+        except ValueError:
+            return None
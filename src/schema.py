@@ -0,0 +1,32 @@
+"""
+Table names, columns and SQL fragments shared by ingestion (which builds the
+compact layout) and the query side (which reads it), so that the query side
+does not need to import the ingestion script.
+"""
+
+# Columns of the tables the rest of the application (and the LLM prompt) queries.
+# In the compact layout these names are views over typed, dictionary-encoded tables.
+TABLE_COLUMNS = {
+    "total_sales_metrics": ["date", "item_id", "total_sales", "total_units_ordered"],
+    "ad_sales_metrics": ["date", "item_id", "ad_sales", "impressions", "ad_spend", "clicks", "units_sold"],
+    "product_eligibility": ["eligibility_datetime_utc", "item_id", "eligibility", "message"],
+}
+
+# Storage values -> the column formats of the original tables ('2025-06-04 08:50:07.115000',
+# without the fraction when it is zero, as pandas wrote them)
+DATETIME_FROM_MS_SQL = ("strftime('%Y-%m-%d %H:%M:%S', f.eligibility_ts / 1000, 'unixepoch') || "
+                        "CASE WHEN f.eligibility_ts % 1000 THEN printf('.%06d', f.eligibility_ts % 1000 * 1000) "
+                        "ELSE '' END")
+
+# Compatibility views: same names, columns and value formats as the original tables.
+# DataIngestion._rebuild_views recreates them together with the partitioned views.
+ELIGIBILITY_VIEWS = {
+    "product_eligibility": "eligibility_fact",
+    "current_product_eligibility": "eligibility_current",
+}
+
+def eligibility_view_sql(source_table):
+    return f"""SELECT {DATETIME_FROM_MS_SQL} AS eligibility_datetime_utc, i.item_id AS item_id,
+               f.eligible AS eligibility, m.message AS message
+        FROM {source_table} f JOIN items i ON i.item_key = f.item_key
+        LEFT JOIN eligibility_messages m ON m.message_key = f.message_key"""
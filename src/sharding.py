@@ -0,0 +1,631 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from schema import TABLE_COLUMNS
+from database_manager import DatabaseManager, scan_result_types
+from partitioning import PARTITIONED_VIEWS, archive_schema_name, load_catalog, view_sql
+from sql_rewriter import (_FROM_JOIN_RE, _IDENTIFIER_RE, _OUTPUT_ALIAS_RE, _QUALIFIED_RE, _aggregate_calls,
+                          _mask_literals, _split_top_level, split_clauses, split_conjuncts)
+
+logger = logging.getLogger(__name__)
+
+# Views every shard exposes; the union fallback combines them across shards
+SHARDED_VIEWS = list(TABLE_COLUMNS) + ["current_product_eligibility"]
+
+# Aggregates that can be computed per shard and combined afterwards (AVG as TOTAL and COUNT)
+PARTIAL_AGGREGATES = {"SUM", "TOTAL", "COUNT", "AVG", "MIN", "MAX"}
+
+# Words that may appear outside aggregates without referring to a column
+_SQL_WORDS = {"as", "asc", "desc", "and", "or", "not", "null", "case", "when", "then", "else", "end", "is", "in",
+              "cast", "real", "integer", "text", "numeric", "like", "between", "collate", "nocase", "distinct"}
+_LIMIT_RE = re.compile(r"^\s*(\d+)\s*(?:(?:OFFSET\s+(\d+))|(?:,\s*(\d+)))?\s*$", re.IGNORECASE)
+_ORDER_TERM_RE = re.compile(r"^(.*?)(?:\s+(ASC|DESC))?(?:\s+NULLS\s+(?:FIRST|LAST))?\s*$", re.IGNORECASE | re.DOTALL)
+_COMMA_RE = re.compile(",")
+
+def normalize_item_id(value):
+    """item_id as stored by ingestion (INTEGER affinity): whole numbers, given as numbers or digits, are integers."""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    elif isinstance(value, str) and re.fullmatch(r"[+-]?\d+", value.strip()):
+        value = int(value)
+    return str(value)
+
+def _normalize(expression):
+    return " ".join(expression.lower().split())
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+def max_attached_databases():
+    """How many databases one SQLite connection may attach (SQLITE_MAX_ATTACHED, 10 unless SQLite was rebuilt)."""
+    conn = sqlite3.connect(":memory:")
+    try:
+        return conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    except AttributeError:  # Connection.getlimit() needs Python 3.11
+        return 10
+    finally:
+        conn.close()
+
+def check_shard_count(shard_count):
+    """Reject shard counts the union fallback cannot serve: it attaches every shard to one connection."""
+    if shard_count < 1:
+        raise ValueError("A shard set needs at least one shard")
+    limit = max_attached_databases()
+    if shard_count > limit:
+        raise ValueError(f"{shard_count} shards exceed SQLite's limit of {limit} attached databases; queries that "
+                         f"cannot be split attach every shard, so use at most {limit} shards")
+
+class UnsupportedShardQuery(Exception):
+    """The query cannot be split into per-shard parts; it runs over the union of the shards instead."""
+
+class ShardRouter:
+    """Maps an item_id to a shard: by the item's seller when a seller map is given, else by item_id hash."""
+
+    def __init__(self, shard_count, item_sellers=None):
+        self.shard_count = shard_count
+        self.item_sellers = item_sellers or {}
+
+    def shard_for(self, item_id):
+        item_id = normalize_item_id(item_id)
+        key = self.item_sellers.get(item_id)
+        key = f"seller:{key}" if key is not None else f"item:{item_id}"
+        return zlib.crc32(key.encode("utf-8")) % self.shard_count
+
+def load_seller_map(path):
+    """Read an item_id -> seller_id map from a CSV file with those two columns."""
+    with open(path, newline="") as f:
+        return {normalize_item_id(row["item_id"]): row["seller_id"] for row in csv.DictReader(f)}
+
+class ShardSet:
+    """
+    A set of shard databases described by a JSON manifest:
+    {"strategy": "hash" | "seller", "shards": [paths], "seller_map": csv path}.
+    Paths are relative to the manifest. All rows of an item live in one shard.
+    """
+
+    def __init__(self, manifest_path):
+        self.manifest_path = os.path.abspath(manifest_path)
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+        base_dir = os.path.dirname(self.manifest_path)
+        self.strategy = manifest.get("strategy", "hash")
+        self.shard_paths = [os.path.join(base_dir, path) for path in manifest["shards"]]
+        check_shard_count(len(self.shard_paths))
+        item_sellers = None
+        if manifest.get("seller_map"):
+            item_sellers = load_seller_map(os.path.join(base_dir, manifest["seller_map"]))
+        self.router = ShardRouter(len(self.shard_paths), item_sellers)
+
+    @classmethod
+    def create(cls, manifest_path, shard_count=4, seller_map=None):
+        """Write a manifest and create empty shard databases next to it."""
+        check_shard_count(shard_count)
+        base_dir = os.path.dirname(os.path.abspath(manifest_path))
+        os.makedirs(base_dir, exist_ok=True)
+        stem = os.path.splitext(os.path.basename(manifest_path))[0]
+        manifest = {
+            "strategy": "seller" if seller_map else "hash",
+            "shards": [f"{stem}_{index:02d}.db" for index in range(shard_count)],
+        }
+        if seller_map:
+            manifest["seller_map"] = os.path.relpath(os.path.abspath(seller_map), base_dir)
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        # Ingestion is only needed for writing, so serving does not import it
+        from data_ingestion import DataIngestion
+        shard_set = cls(manifest_path)
+        for path in shard_set.shard_paths:
+            DataIngestion(db_path=path).create_tables()
+        return shard_set
+
+    def insert_rows(self, table_name, columns, rows):
+        """Route rows (in the columns of a TABLE_COLUMNS table) to their shards and insert them."""
+        from data_ingestion import DataIngestion
+        item_index = columns.index("item_id")
+        batches = [[] for _ in self.shard_paths]
+        for row in rows:
+            batches[self.router.shard_for(row[item_index])].append(row)
+        for path, batch in zip(self.shard_paths, batches):
+            if batch:
+                DataIngestion(db_path=path).insert_rows(table_name, columns, batch)
+
+def split_database(source_path, manifest_path, shard_count=4, seller_map=None, batch_size=50000):
+    """Copy every row of a single-file database into a new set of shards."""
+    shard_set = ShardSet.create(manifest_path, shard_count, seller_map)
+    # Read through DatabaseManager, whose views also cover partitions archived to other files
+    source = DatabaseManager(source_path, pool_size=1)
+    for table_name, columns in TABLE_COLUMNS.items():
+        for _, rows in source.stream_query(f"SELECT {', '.join(columns)} FROM {table_name};", batch_size):
+            if rows:
+                shard_set.insert_rows(table_name, columns, rows)
+        print(f"Split {table_name} into {shard_count} shards.")
+    return shard_set
+
+class ShardQueryPlan:
+    """How a query runs on a set of shards: the per-shard query and the merge over their results."""
+
+    def __init__(self, strategy, shard_query, merge_query, columns=None):
+        self.strategy = strategy
+        self.shard_query = shard_query
+        self.merge_query = merge_query
+        self.columns = columns
+
+    def to_dict(self):
+        return {"strategy": self.strategy, "shard_query": self.shard_query, "merge_query": self.merge_query}
+
+class ShardQueryPlanner:
+    """
+    Splits a SELECT into a query run on every shard and a merge query run over
+    the concatenated shard results (table "merged", columns c0, c1, ...).
+
+    - "scatter_gather": row queries and queries grouped by item_id. Every
+      group is complete inside one shard, so each shard runs the query itself
+      (with LIMIT n + offset) and the merge re-applies ORDER BY and LIMIT.
+    - "partial_aggregate": other aggregate queries. Each shard computes
+      SUM / COUNT / MIN / MAX partials per group (AVG as SUM and COUNT); the
+      merge combines them and applies HAVING, ORDER BY and LIMIT.
+
+    Anything else raises UnsupportedShardQuery.
+    """
+
+    def plan(self, query):
+        clauses = split_clauses(query)
+        if clauses is None or "FROM" not in clauses:
+            raise UnsupportedShardQuery("not a single SELECT statement")
+        self._check_shard_local(clauses)
+        limit = self._parse_limit(clauses.get("LIMIT"))
+        select = clauses["SELECT"]
+        distinct = bool(re.match(r"\s*DISTINCT\b", select, re.IGNORECASE))
+        if distinct:
+            select = re.sub(r"^\s*DISTINCT\s+", "", select, flags=re.IGNORECASE)
+        items = [self._split_alias(item) for item in _split_top_level(select, _COMMA_RE)]
+        calls = []
+        for name in ("SELECT", "HAVING", "ORDER BY"):
+            text_calls = _aggregate_calls(clauses.get(name, ""))
+            if text_calls is None:
+                raise UnsupportedShardQuery("unbalanced parentheses")
+            calls.extend(text_calls)
+        group_keys = self._group_keys(clauses.get("GROUP BY"), items)
+        if not calls and not group_keys or any(self._is_item_id(key) for key in group_keys):
+            return self._scatter_gather(clauses, items, distinct, limit)
+        if distinct:
+            raise UnsupportedShardQuery("SELECT DISTINCT with aggregates")
+        return self._partial_aggregate(clauses, items, group_keys, limit)
+
+    @staticmethod
+    def _check_shard_local(clauses):
+        for name, text in clauses.items():
+            masked = _mask_literals(text)
+            if re.search(r"\bSELECT\b", masked, re.IGNORECASE):
+                raise UnsupportedShardQuery("subqueries see only one shard")
+            if re.search(r"\bOVER\b", masked, re.IGNORECASE):
+                raise UnsupportedShardQuery("window functions")
+        from_clause = clauses["FROM"]
+        masked_from = _mask_literals(from_clause)
+        if "," in masked_from or "(" in masked_from:
+            raise UnsupportedShardQuery("only single tables and item_id joins are shard-local")
+        if re.search(r"\bJOIN\b", masked_from, re.IGNORECASE):
+            join = _FROM_JOIN_RE.match(from_clause)
+            if join is None:
+                raise UnsupportedShardQuery("unsupported join")
+            # Rows of one item share a shard, so only joins matching item_id stay inside a shard
+            on_item_id = any(
+                re.fullmatch(r"\s*\w+\.item_id\s*=\s*\w+\.item_id\s*", condition, re.IGNORECASE)
+                for condition in split_conjuncts(join.group(5)))
+            if not on_item_id:
+                raise UnsupportedShardQuery("join does not match item_id")
+
+    @staticmethod
+    def _parse_limit(limit):
+        if limit is None:
+            return None
+        match = _LIMIT_RE.match(limit)
+        if not match:
+            raise UnsupportedShardQuery("LIMIT must be a number")
+        if match.group(3) is not None:
+            # "LIMIT offset, count"
+            return int(match.group(3)), int(match.group(1))
+        return int(match.group(1)), int(match.group(2) or 0)
+
+    @staticmethod
+    def _split_alias(item):
+        match = _OUTPUT_ALIAS_RE.search(_mask_literals(item))
+        if match:
+            return item[:match.start()].strip(), match.group(1)
+        return item.strip(), None
+
+    @staticmethod
+    def _is_item_id(expression):
+        return re.fullmatch(r"(?:\w+\.)?item_id", expression.strip(), re.IGNORECASE) is not None
+
+    def _group_keys(self, group_by, items):
+        if not group_by:
+            return []
+        keys = []
+        aliases = {alias.lower(): expression for expression, alias in items if alias}
+        for term in _split_top_level(group_by, _COMMA_RE):
+            if term.isdigit() and 1 <= int(term) <= len(items):
+                term = items[int(term) - 1][0]
+            keys.append(aliases.get(term.lower(), term))
+        return keys
+
+    @staticmethod
+    def _output_name(expression, alias):
+        return alias or expression
+
+    def _order_terms(self, order_by, items, columns_for_term):
+        terms = []
+        for term in _split_top_level(order_by, _COMMA_RE):
+            match = _ORDER_TERM_RE.match(term)
+            expression, direction = match.group(1).strip(), (match.group(2) or "ASC").upper()
+            terms.append(f"{columns_for_term(expression)} {direction}")
+        return ", ".join(terms)
+
+    @staticmethod
+    def _limit_clause(limit):
+        if limit is None:
+            return ""
+        count, offset = limit
+        return f" LIMIT {count}" + (f" OFFSET {offset}" if offset else "")
+
+    def _scatter_gather(self, clauses, items, distinct, limit):
+        if any(expression == "*" or expression.endswith(".*") for expression, _ in items) and "ORDER BY" in clauses:
+            raise UnsupportedShardQuery("ORDER BY with SELECT *")
+        names = [_normalize(self._output_name(expression, alias)) for expression, alias in items]
+        expressions = [_normalize(expression) for expression, _ in items]
+
+        def column_for(term):
+            normalized = _normalize(term)
+            if term.isdigit() and 1 <= int(term) <= len(items):
+                return f"c{int(term) - 1}"
+            for candidates in (names, expressions):
+                if normalized in candidates:
+                    return f"c{candidates.index(normalized)}"
+            # A bare column also matches a qualified select item (t1.item_id -> item_id)
+            bare = [index for index, expression in enumerate(expressions) if expression.split(".")[-1] == normalized]
+            if len(bare) == 1:
+                return f"c{bare[0]}"
+            raise UnsupportedShardQuery(f"ORDER BY term '{term}' is not an output column")
+
+        shard_clauses = dict(clauses)
+        merge = "SELECT DISTINCT * FROM merged" if distinct else "SELECT * FROM merged"
+        if "ORDER BY" in clauses:
+            merge += " ORDER BY " + self._order_terms(clauses["ORDER BY"], items, column_for)
+        merge += self._limit_clause(limit)
+        if limit is not None:
+            # Every group is complete in its shard, so a shard never needs more than count + offset rows
+            shard_clauses["LIMIT"] = str(limit[0] + limit[1])
+        return ShardQueryPlan("scatter_gather", _assemble(shard_clauses), merge)
+
+    def _partial_aggregate(self, clauses, items, group_keys, limit):
+        partials = []  # shard expressions, in column order after the group keys
+        key_columns = {_normalize(key): f"k{index}" for index, key in enumerate(group_keys)}
+        output_aliases = {alias.lower() for _, alias in items if alias}
+
+        def partial(expression):
+            if expression not in partials:
+                partials.append(expression)
+            return f"p{partials.index(expression)}"
+
+        def merge_call(function, argument):
+            if re.match(r"\s*DISTINCT\b", argument, re.IGNORECASE):
+                # Items never span shards, so distinct items can be counted per shard
+                if function != "COUNT" or not self._is_item_id(re.sub(r"^\s*DISTINCT\s+", "", argument, flags=re.I)):
+                    raise UnsupportedShardQuery(f"{function}(DISTINCT ...) across shards")
+                return f"SUM({partial(f'COUNT({argument})')})"
+            if function not in PARTIAL_AGGREGATES:
+                raise UnsupportedShardQuery(f"{function} cannot be combined across shards")
+            if function == "AVG":
+                total, count = partial(f"TOTAL({argument})"), partial(f"COUNT({argument})")
+                return f"(SUM({total}) / NULLIF(SUM({count}), 0))"
+            if function == "COUNT":
+                return f"SUM({partial(f'COUNT({argument})')})"
+            if function == "TOTAL":
+                return f"TOTAL({partial(f'TOTAL({argument})')})"
+            return f"{function}({partial(f'{function}({argument})')})"
+
+        def rewrite(text, allow_aliases):
+            calls = _aggregate_calls(text)
+            pieces = []
+            position = 0
+            for function, argument, start, end in calls:
+                pieces.append(self._replace_keys(text[position:start], key_columns, output_aliases if allow_aliases
+                                                 else set()))
+                pieces.append(merge_call(function, argument))
+                position = end
+            pieces.append(self._replace_keys(text[position:], key_columns,
+                                             output_aliases if allow_aliases else set()))
+            return "".join(pieces)
+
+        merge_items = []
+        for index, (expression, alias) in enumerate(items):
+            if expression == "*" or expression.endswith(".*"):
+                raise UnsupportedShardQuery("SELECT * with aggregates")
+            merge_items.append(f"{rewrite(expression, False)} AS {_quote(self._output_name(expression, alias))}")
+        having = rewrite(clauses["HAVING"], True) if "HAVING" in clauses else None
+        order_by = None
+        if "ORDER BY" in clauses:
+            terms = []
+            for term in _split_top_level(clauses["ORDER BY"], _COMMA_RE):
+                match = _ORDER_TERM_RE.match(term)
+                expression, direction = match.group(1).strip(), (match.group(2) or "ASC").upper()
+                if expression.isdigit():
+                    terms.append(f"{expression} {direction}")
+                else:
+                    terms.append(f"{rewrite(expression, True)} {direction}")
+            order_by = ", ".join(terms)
+
+        shard_select = [f"{key} AS k{index}" for index, key in enumerate(group_keys)]
+        shard_select += [f"{expression} AS p{index}" for index, expression in enumerate(partials)]
+        shard_clauses = {"SELECT": ", ".join(shard_select), "FROM": clauses["FROM"]}
+        if "WHERE" in clauses:
+            shard_clauses["WHERE"] = clauses["WHERE"]
+        if group_keys:
+            shard_clauses["GROUP BY"] = ", ".join(group_keys)
+
+        merge = f"SELECT {', '.join(merge_items)} FROM merged"
+        if group_keys:
+            merge += " GROUP BY " + ", ".join(f"k{index}" for index in range(len(group_keys)))
+        if having:
+            merge += f" HAVING {having}"
+        if order_by:
+            merge += f" ORDER BY {order_by}"
+        merge += self._limit_clause(limit)
+        columns = [f"k{index}" for index in range(len(group_keys))] + [f"p{index}" for index in range(len(partials))]
+        return ShardQueryPlan("partial_aggregate", _assemble(shard_clauses), merge, columns)
+
+    @staticmethod
+    def _replace_keys(text, key_columns, output_aliases):
+        """Replace group-key expressions by their merged column; any other column reference is unsupported."""
+        for key, column in sorted(key_columns.items(), key=lambda pair: -len(pair[0])):
+            text = re.sub(rf"(?<![\w.]){re.escape(key)}(?![\w])", column, text, flags=re.IGNORECASE)
+        masked = _mask_literals(text)
+        if _QUALIFIED_RE.search(masked):
+            raise UnsupportedShardQuery("column outside aggregates that is not grouped")
+        for match in _IDENTIFIER_RE.finditer(masked):
+            identifier = match.group(1).lower()
+            if identifier in _SQL_WORDS or identifier in output_aliases or re.fullmatch(r"k\d+", identifier):
+                continue
+            raise UnsupportedShardQuery(f"column '{match.group(1)}' outside aggregates is not grouped")
+        return text
+
+def _assemble(clauses):
+    order = ["SELECT", "FROM", "WHERE", "GROUP BY", "HAVING", "ORDER BY", "LIMIT"]
+    return " ".join(f"{name} {clauses[name]}" for name in order if name in clauses) + ";"
+
+def merge_results(plan, results):
+    """Run a plan's merge query over the per-shard results in an in-memory database."""
+    columns = plan.columns or results[0]["columns"]
+    conn = sqlite3.connect(":memory:")
+    try:
+        internal = [f"c{index}" for index in range(len(columns))] if plan.columns is None else columns
+        conn.execute(f"CREATE TABLE merged ({', '.join(internal)});")
+        placeholders = ", ".join("?" for _ in internal)
+        for result in results:
+            conn.executemany(f"INSERT INTO merged VALUES ({placeholders});", result["data"])
+        cursor = conn.execute(plan.merge_query)
+        rows = cursor.fetchall()
+        if plan.columns is None:
+            # scatter_gather keeps the shard's own column names
+            return rows, list(columns)
+        return rows, [description[0] for description in cursor.description]
+    finally:
+        conn.close()
+
+class ShardedDatabaseManager:
+    """
+    DatabaseManager over a set of shard databases (see ShardSet). Queries are
+    planned by ShardQueryPlanner and run on every shard in parallel on a thread
+    pool, each through the shard's own DatabaseManager (so fan-out rewrites
+    and partition pruning still apply); the partial results are merged in an
+    in-memory SQLite database. Queries the planner cannot split run once over
+    temporary views that union the shards.
+    """
+
+    def __init__(self, manifest_path, pool_size=4, max_workers=None):
+        self.shard_set = ShardSet(manifest_path)
+        self.db_path = self.shard_set.manifest_path
+        self.shards = [DatabaseManager(path, pool_size=pool_size) for path in self.shard_set.shard_paths]
+        self.max_workers = max_workers or len(self.shards)
+        self.planner = ShardQueryPlanner()
+        self.schema = None
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        # Worker threads do not survive a fork, so each process builds its own pool
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="shard")
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _scatter(self, function):
+        return list(self.executor.map(function, self.shards))
+
+    def execute_query(self, query):
+        """Execute a SQL query on all shards and return the merged results."""
+        try:
+            plan = self.planner.plan(query)
+        except UnsupportedShardQuery as e:
+            logger.info(f"Running query over the union of the shards: {e}")
+            return self._execute_union(query, str(e))
+        try:
+            results = self._scatter(lambda shard: shard.execute_query(plan.shard_query))
+            for result in results:
+                if not result["success"]:
+                    return result
+            rows, columns = merge_results(plan, results)
+            report = plan.to_dict()
+            report["shards"] = len(self.shards)
+            return {"success": True, "data": rows, "columns": columns, "sharding": report}
+        except sqlite3.Error as e:
+            return {"success": False, "error": str(e)}
+        except Exception as e:
+            return {"success": False, "error": f"Unexpected error: {str(e)}"}
+
+    def _union_connection(self):
+        """
+        In-memory connection with every shard attached and temp views that union
+        them. A shard's stored views only cover its live partitions, so for a
+        shard with archived partitions the archive files are attached too and
+        its part of the union is built from its partition catalog.
+        """
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+        try:
+            branches = {view_name: [] for view_name in SHARDED_VIEWS}
+            for index, path in enumerate(self.shard_set.shard_paths):
+                self._attach(conn, path, f"shard{index}")
+                partitions = self._shard_partitions(conn, index, path)
+                for view_name in SHARDED_VIEWS:
+                    if view_name in PARTITIONED_VIEWS and any(p.archive_path for p in partitions):
+                        base_table = PARTITIONED_VIEWS[view_name]["base_table"]
+                        tables = [f"shard{index}.{base_table}"] + [p.qualified_name for p in partitions
+                                                                   if p.base_table == base_table]
+                        branches[view_name].append(view_sql(view_name, tables, items_table=f"shard{index}.items"))
+                    else:
+                        branches[view_name].append(f"SELECT * FROM shard{index}.{view_name}")
+            for view_name, selects in branches.items():
+                conn.execute(f"CREATE TEMP VIEW {view_name} AS {' UNION ALL '.join(selects)};")
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    @staticmethod
+    def _attach(conn, path, schema):
+        try:
+            conn.execute(f"ATTACH DATABASE ? AS {schema};", (path,))
+        except sqlite3.OperationalError as e:
+            raise sqlite3.OperationalError(
+                f"Cannot attach {path} for the union of the shards, which attaches every shard and archive file "
+                f"(SQLite allows {max_attached_databases()}): {e}") from e
+
+    def _shard_partitions(self, conn, index, path):
+        """A shard's partition catalog, with the archive files of archived partitions attached to conn."""
+        catalog_conn = sqlite3.connect(path)
+        try:
+            partitions = load_catalog(catalog_conn.cursor())
+        finally:
+            catalog_conn.close()
+        available = []
+        for partition in partitions:
+            partition.schema = f"shard{index}"
+            if partition.archive_path:
+                archive_file = os.path.join(os.path.dirname(path), partition.archive_path)
+                if not os.path.exists(archive_file):
+                    logger.warning(f"Archive {archive_file} for {partition.table_name} is missing; skipping it")
+                    continue
+                partition.schema = f"shard{index}_{archive_schema_name(partition.archive_path)}"
+                if conn.execute("SELECT 1 FROM pragma_database_list WHERE name = ?;",
+                                (partition.schema,)).fetchone() is None:
+                    self._attach(conn, archive_file, partition.schema)
+            available.append(partition)
+        return available
+
+    def _execute_union(self, query, reason):
+        try:
+            conn = self._union_connection()
+            try:
+                cursor = conn.execute(query)
+                results = cursor.fetchall()
+                column_names = [description[0] for description in cursor.description]
+            finally:
+                conn.close()
+            return {"success": True, "data": results, "columns": column_names,
+                    "sharding": {"strategy": "union", "reason": reason, "shards": len(self.shards)}}
+        except sqlite3.Error as e:
+            return {"success": False, "error": str(e)}
+        except Exception as e:
+            return {"success": False, "error": f"Unexpected error: {str(e)}"}
+
+    def stream_query(self, query, chunk_size=5000, read_only=False):
+        """Stream a query's result over the union of the shards, one fetchmany() chunk at a time."""
+        conn = self._union_connection()
+        if read_only:
+            conn.execute("PRAGMA query_only = ON;")
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query)
+            columns = [description[0] for description in cursor.description or []]
+            empty = True
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                empty = False
+                yield columns, rows
+            if empty:
+                yield columns, []
+        finally:
+            cursor.close()
+            conn.close()
+
+    def get_result_types(self, query, read_only=False):
+        """The storage classes in each column of the query's result over the union of the shards."""
+        conn = self._union_connection()
+        try:
+            if read_only:
+                conn.execute("PRAGMA query_only = ON;")
+            return scan_result_types(conn, query)
+        finally:
+            conn.close()
+
+    def get_eligibility_as_of(self, as_of=None, item_id=None):
+        """Eligibility as of a point in time, gathered from the shards (each item lives in one)."""
+        if item_id is not None:
+            shard = self.shards[self.shard_set.router.shard_for(item_id)]
+            return shard.get_eligibility_as_of(as_of=as_of, item_id=item_id)
+        results = self._scatter(lambda shard: shard.get_eligibility_as_of(as_of=as_of))
+        for result in results:
+            if not result["success"]:
+                return result
+        return {"success": True, "data": [row for result in results for row in result["data"]],
+                "columns": results[0]["columns"]}
+
+    def get_data_version(self):
+        return "/".join(shard.get_data_version() for shard in self.shards)
+
+    def get_table_info(self):
+        """Tables and views of the first shard; every shard has the same schema."""
+        return self.shards[0].get_table_info()
+
+    def warm_up(self):
+        for shard in self.shards:
+            shard.warm_up()
+        self.schema = self.shards[0].schema
+        return self.schema
+
+    def reset_pool(self):
+        for shard in self.shards:
+            shard.reset_pool()
+        with self._lock:
+            self._executor = None
+
+    validate_query = DatabaseManager.validate_query
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split a database into shards by item_id hash or by seller.")
+    parser.add_argument("manifest", help="Manifest file to create; shard files are written next to it")
+    parser.add_argument("--source", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                                                         "ecommerce_data.db"),
+                        help="Single-file database to split")
+    parser.add_argument("--shards", type=int, default=4, help="Number of shards")
+    parser.add_argument("--seller-map", help="CSV with item_id,seller_id columns; keeps each seller in one shard")
+    args = parser.parse_args()
+
+    try:
+        split_database(args.source, args.manifest, args.shards, args.seller_map)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Wrote {args.manifest}")
@@ -0,0 +1,369 @@
+import re
+
+# Tables whose rows are keyed by (time column, item_id): joining two of them on
+# item_id alone pairs every time row of one side with every time row of the other.
+TABLE_GRAIN = {
+    "total_sales_metrics": "date",
+    "ad_sales_metrics": "date",
+    "product_eligibility": "eligibility_datetime_utc",
+}
+
+TABLE_COLUMNS = {
+    "total_sales_metrics": {"date", "item_id", "total_sales", "total_units_ordered"},
+    "ad_sales_metrics": {"date", "item_id", "ad_sales", "impressions", "ad_spend", "clicks", "units_sold"},
+    "product_eligibility": {"eligibility_datetime_utc", "item_id", "eligibility", "message"},
+}
+
+# Aggregates that give the same answer over per-item partial results
+DECOMPOSABLE_AGGREGATES = {"SUM", "TOTAL", "MIN", "MAX"}
+
+# Aggregates whose intended meaning survives matching the two sides day by day
+DAILY_AGGREGATES = {"SUM", "TOTAL", "AVG"}
+
+DATE_JOIN_SEMANTICS = ("Rows are paired by item_id and date instead of by item_id alone, so the aggregates "
+                       "combine each day's values with the same day's values on the other side. Days present "
+                       "on only one side no longer contribute.")
+
+_CLAUSE_RE = re.compile(r"\b(SELECT|FROM|WHERE|GROUP\s+BY|HAVING|ORDER\s+BY|LIMIT)\b", re.IGNORECASE)
+_SET_OPERATION_RE = re.compile(r"\b(UNION|INTERSECT|EXCEPT|WITH)\b", re.IGNORECASE)
+_AGGREGATE_RE = re.compile(r"\b(SUM|TOTAL|MIN|MAX|AVG|COUNT|GROUP_CONCAT)\s*\(", re.IGNORECASE)
+_QUALIFIED_RE = re.compile(r"\b([A-Za-z_]\w*)\.([A-Za-z_]\w*)\b")
+_IDENTIFIER_RE = re.compile(r"(?<![\w.])([A-Za-z_]\w*)\b(?!\s*[.(])")
+_OUTPUT_ALIAS_RE = re.compile(r"\bAS\s+([A-Za-z_]\w*)\s*$", re.IGNORECASE)
+_FROM_JOIN_RE = re.compile(
+    r"^\s*([A-Za-z_]\w*)(?:\s+(?:AS\s+)?(?!INNER\b|JOIN\b)([A-Za-z_]\w*))?"
+    r"\s+(?:INNER\s+)?JOIN\s+"
+    r"([A-Za-z_]\w*)(?:\s+(?:AS\s+)?(?!ON\b)([A-Za-z_]\w*))?"
+    r"\s+ON\s+(.+?)\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+_EQUALITY_RE = re.compile(r"^\s*([A-Za-z_]\w*)\.([A-Za-z_]\w*)\s*=\s*([A-Za-z_]\w*)\.([A-Za-z_]\w*)\s*$")
+
+def _mask_literals(sql):
+    """Blank out the contents of string literals so keywords inside them are ignored."""
+    def blank(match):
+        text = match.group(0)
+        return text[0] + " " * (len(text) - 2) + text[-1]
+    return re.sub(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"", blank, sql)
+
+def _depths(masked):
+    depths = []
+    depth = 0
+    for char in masked:
+        if char == "(":
+            depth += 1
+        depths.append(depth)
+        if char == ")":
+            depth -= 1
+    return depths
+
+def _split_top_level(sql, separator_re):
+    """Split on a separator that appears outside parentheses and string literals."""
+    masked = _mask_literals(sql)
+    depths = _depths(masked)
+    parts = []
+    start = 0
+    for match in separator_re.finditer(masked):
+        if depths[match.start()] == 0:
+            parts.append(sql[start:match.start()])
+            start = match.end()
+    parts.append(sql[start:])
+    return [part.strip() for part in parts]
+
+def split_clauses(sql):
+    """
+    Split a single SELECT statement into its top-level clauses.
+    Returns a dict keyed by clause name ("SELECT", "FROM", "WHERE", "GROUP BY",
+    "HAVING", "ORDER BY", "LIMIT") or None if the statement has another shape.
+    """
+    sql = sql.strip().rstrip(";").strip()
+    masked = _mask_literals(sql)
+    depths = _depths(masked)
+    if any(depths[m.start()] == 0 for m in _SET_OPERATION_RE.finditer(masked)) or ";" in masked:
+        return None
+    order = ["SELECT", "FROM", "WHERE", "GROUP BY", "HAVING", "ORDER BY", "LIMIT"]
+    found = []
+    for match in _CLAUSE_RE.finditer(masked):
+        if depths[match.start()] == 0:
+            found.append((" ".join(match.group(1).upper().split()), match.start(), match.end()))
+    if not found or found[0][0] != "SELECT" or found[0][1] != 0:
+        return None
+    names = [name for name, _, _ in found]
+    if len(set(names)) != len(names) or names != sorted(names, key=order.index):
+        return None
+    clauses = {}
+    for index, (name, _, body_start) in enumerate(found):
+        body_end = found[index + 1][1] if index + 1 < len(found) else len(sql)
+        clauses[name] = sql[body_start:body_end].strip()
+    return clauses
+
+def split_conjuncts(where):
+    """Split a WHERE clause into its top-level AND-ed conditions."""
+    parts = _split_top_level(where, re.compile(r"\bAND\b", re.IGNORECASE))
+    conjuncts = []
+    for part in parts:
+        # Re-attach the upper bound of "x BETWEEN a AND b"
+        if conjuncts and re.search(r"\bBETWEEN\b(?!.*\bAND\b)", _mask_literals(conjuncts[-1]),
+                                   re.IGNORECASE | re.DOTALL):
+            conjuncts[-1] = f"{conjuncts[-1]} AND {part}"
+        else:
+            conjuncts.append(part)
+    return conjuncts
+
+def _aggregate_calls(text):
+    """Return (function, argument, start, end) for each aggregate call in text."""
+    masked = _mask_literals(text)
+    calls = []
+    position = 0
+    while True:
+        match = _AGGREGATE_RE.search(masked, position)
+        if not match:
+            return calls
+        depth = 0
+        for end in range(match.end() - 1, len(masked)):
+            if masked[end] == "(":
+                depth += 1
+            elif masked[end] == ")":
+                depth -= 1
+                if depth == 0:
+                    break
+        else:
+            return None
+        calls.append((match.group(1).upper(), text[match.end():end].strip(), match.start(), end + 1))
+        position = end + 1
+
+def _strip_spans(text, spans):
+    for start, end in sorted(spans, reverse=True):
+        text = text[:start] + " " + text[end:]
+    return text
+
+class FanOutRewrite:
+    """A rewritten query plus what was changed and why."""
+
+    def __init__(self, strategy, tables, original_query, rewritten_query, semantic_change=None):
+        self.strategy = strategy
+        self.tables = tables
+        self.original_query = original_query
+        self.rewritten_query = rewritten_query
+        # Set when the rewrite changes what the query means, not only what it costs
+        self.semantic_change = semantic_change
+
+    def to_dict(self):
+        report = {
+            "strategy": self.strategy,
+            "tables": list(self.tables),
+            "original_query": self.original_query,
+            "rewritten_query": self.rewritten_query,
+        }
+        if self.semantic_change:
+            report["semantic_change"] = self.semantic_change
+        return report
+
+class FanOutJoinRewriter:
+    """
+    Detects aggregate queries that join two time-grained tables (see
+    TABLE_GRAIN) on item_id only and rewrites them so the join no longer
+    multiplies every time row of one side by every time row of the other:
+
+    - "pre_aggregate": when every aggregate is SUM/TOTAL/MIN/MAX over one
+      table's column and every row filter touches one table, each side is
+      replaced by a per-item subquery computing those aggregates, and the
+      join pairs one row per item from each side.
+    - "date_join": otherwise, when both sides are daily tables and every
+      aggregate is a SUM/TOTAL/AVG over per-day measure columns, the join is
+      restricted to matching days with "AND a.date = b.date". This changes
+      the meaning of the query (see DATE_JOIN_SEMANTICS), which the rewrite
+      reports; COUNT, MIN/MAX and the like are never rewritten this way.
+
+    Anything the rewriter does not fully understand is left untouched.
+    """
+
+    def rewrite(self, query):
+        """Return a FanOutRewrite, or None if the query needs no (or no safe) rewrite."""
+        clauses = split_clauses(query)
+        if clauses is None or "FROM" not in clauses:
+            return None
+        join = _FROM_JOIN_RE.match(clauses["FROM"])
+        if join is None or "(" in clauses["FROM"] or "," in _mask_literals(clauses["FROM"]):
+            return None
+        left_table, left_alias, right_table, right_alias, on_clause = join.groups()
+        left_table, right_table = left_table.lower(), right_table.lower()
+        if left_table not in TABLE_GRAIN or right_table not in TABLE_GRAIN:
+            return None
+        left_alias = left_alias or left_table
+        right_alias = right_alias or right_table
+        aliases = {left_alias.lower(): left_table, right_alias.lower(): right_table}
+        if len(aliases) != 2:
+            return None
+
+        # The join must be on item_id only (a join that already matches the time column is fine)
+        join_columns = set()
+        for condition in _split_top_level(on_clause, re.compile(r"\bAND\b", re.IGNORECASE)):
+            equality = _EQUALITY_RE.match(condition)
+            if not equality:
+                return None
+            a_alias, a_column, b_alias, b_column = (part.lower() for part in equality.groups())
+            if {a_alias, b_alias} != set(aliases) or a_column != b_column:
+                return None
+            join_columns.add(a_column)
+        if join_columns != {"item_id"}:
+            return None
+
+        # Only aggregate queries multiply their work (and their sums) through the fan-out
+        expression_clauses = [clauses.get(name, "") for name in ("SELECT", "HAVING", "ORDER BY")]
+        calls = []
+        for text in expression_clauses:
+            text_calls = _aggregate_calls(text)
+            if text_calls is None:
+                return None
+            calls.extend(text_calls)
+        if not calls:
+            return None
+        if not self._only_qualified_columns(clauses, aliases):
+            return None
+
+        rewritten = self._pre_aggregate(clauses, aliases, left_alias, right_alias, on_clause)
+        if rewritten is not None:
+            return FanOutRewrite("pre_aggregate", (left_table, right_table), query.strip(), rewritten)
+        if TABLE_GRAIN[left_table] != "date" or TABLE_GRAIN[right_table] != "date":
+            return None
+        if not self._only_daily_aggregates(calls, aliases):
+            return None
+        clauses = dict(clauses)
+        clauses["FROM"] = (f"{left_table} {left_alias} INNER JOIN {right_table} {right_alias} "
+                           f"ON {on_clause} AND {left_alias}.date = {right_alias}.date")
+        return FanOutRewrite("date_join", (left_table, right_table), query.strip(), self._assemble(clauses),
+                             semantic_change=DATE_JOIN_SEMANTICS)
+
+    @staticmethod
+    def _only_daily_aggregates(calls, aliases):
+        """Every aggregate is a SUM/TOTAL/AVG whose argument uses per-day measure columns only."""
+        for function, argument, _, _ in calls:
+            if function not in DAILY_AGGREGATES:
+                return False
+            columns = _QUALIFIED_RE.findall(_mask_literals(argument))
+            if not columns:
+                return False
+            for alias, column_name in columns:
+                table = aliases.get(alias.lower())
+                if table is None or column_name.lower() in ("item_id", TABLE_GRAIN[table]):
+                    return False
+        return True
+
+    def _only_qualified_columns(self, clauses, aliases):
+        """Every column reference must name its table, except references to output aliases."""
+        known_columns = set().union(*(TABLE_COLUMNS[table] for table in aliases.values()))
+        output_aliases = set()
+        for item in _split_top_level(clauses["SELECT"], re.compile(",")):
+            match = _OUTPUT_ALIAS_RE.search(item)
+            if match:
+                output_aliases.add(match.group(1).lower())
+        for name in ("SELECT", "WHERE", "GROUP BY", "HAVING", "ORDER BY"):
+            masked = _mask_literals(clauses.get(name, ""))
+            for match in _IDENTIFIER_RE.finditer(masked):
+                identifier = match.group(1).lower()
+                if identifier in known_columns and identifier not in output_aliases:
+                    return False
+        return True
+
+    def _pre_aggregate(self, clauses, aliases, left_alias, right_alias, on_clause):
+        # Collect the per-table aggregates; every one must be decomposable over items
+        needed = {alias: {} for alias in aliases}
+        for name in ("SELECT", "HAVING", "ORDER BY"):
+            text = clauses.get(name, "")
+            calls = _aggregate_calls(text)
+            for function, argument, _, _ in calls:
+                column = re.fullmatch(r"([A-Za-z_]\w*)\.([A-Za-z_]\w*)", argument)
+                if function not in DECOMPOSABLE_AGGREGATES or column is None:
+                    return None
+                alias, column_name = column.group(1).lower(), column.group(2).lower()
+                if alias not in aliases:
+                    return None
+                if needed[alias].setdefault(column_name, function) != function:
+                    return None
+            # Outside aggregates only item_id may be referenced
+            outside = _strip_spans(text, [(start, end) for _, _, start, end in calls])
+            for alias, column_name in _QUALIFIED_RE.findall(_mask_literals(outside)):
+                if alias.lower() in aliases and column_name.lower() != "item_id":
+                    return None
+        for alias, column_name in _QUALIFIED_RE.findall(_mask_literals(clauses.get("GROUP BY", ""))):
+            if alias.lower() in aliases and column_name.lower() != "item_id":
+                return None
+
+        # Row filters move into the side they filter
+        pushed = {alias: [] for alias in aliases}
+        remaining = []
+        if "WHERE" in clauses:
+            conjuncts = split_conjuncts(clauses["WHERE"])
+            for conjunct in conjuncts:
+                referenced = {alias.lower() for alias, _ in _QUALIFIED_RE.findall(_mask_literals(conjunct))
+                              if alias.lower() in aliases}
+                if len(referenced) > 1:
+                    return None
+                if referenced:
+                    alias = referenced.pop()
+                    pushed[alias].append(re.sub(rf"\b{re.escape(alias)}\.", "", conjunct, flags=re.IGNORECASE))
+                else:
+                    remaining.append(conjunct)
+
+        sides = []
+        for alias in (left_alias, right_alias):
+            table = aliases[alias.lower()]
+            conditions = [self._conjunct(c) for c in pushed[alias.lower()]]
+            where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+            columns = needed[alias.lower()]
+            if columns:
+                select = ", ".join(["item_id"] + [f"{function}({column}) AS {column}"
+                                                  for column, function in columns.items()])
+                sides.append(f"(SELECT {select} FROM {table}{where} GROUP BY item_id) {alias}")
+            else:
+                sides.append(f"(SELECT DISTINCT item_id FROM {table}{where}) {alias}")
+
+        clauses = dict(clauses)
+        clauses["FROM"] = f"{sides[0]} INNER JOIN {sides[1]} ON {on_clause}"
+        if remaining:
+            clauses["WHERE"] = " AND ".join(remaining)
+        else:
+            clauses.pop("WHERE", None)
+        return self._assemble(clauses)
+
+    @staticmethod
+    def _conjunct(condition):
+        # Only a top-level OR binds looser than AND; other conditions stay bare so
+        # that the partition router still recognises date filters
+        if len(_split_top_level(condition, re.compile(r"\bOR\b", re.IGNORECASE))) > 1:
+            return f"({condition})"
+        return condition
+
+    @staticmethod
+    def _assemble(clauses):
+        order = ["SELECT", "FROM", "WHERE", "GROUP BY", "HAVING", "ORDER BY", "LIMIT"]
+        return " ".join(f"{name} {clauses[name]}" for name in order if name in clauses) + ";"
+
+def estimate_join_rows(cursor, rewrite):
+    """
+    Estimate the rows produced by the join before and after a rewrite, from
+    per-item (and per-item-per-day) row counts of the two tables. Row filters
+    are ignored, so these are upper bounds.
+    """
+    left, right = rewrite.tables
+    before_sql = (
+        f"SELECT COALESCE(SUM(a.n * b.n), 0) FROM "
+        f"(SELECT item_id, COUNT(*) AS n FROM {left} GROUP BY item_id) a JOIN "
+        f"(SELECT item_id, COUNT(*) AS n FROM {right} GROUP BY item_id) b ON a.item_id = b.item_id"
+    )
+    if rewrite.strategy == "pre_aggregate":
+        after_sql = (
+            f"SELECT COUNT(*) FROM (SELECT DISTINCT item_id FROM {left}) a JOIN "
+            f"(SELECT DISTINCT item_id FROM {right}) b ON a.item_id = b.item_id"
+        )
+    else:
+        after_sql = (
+            f"SELECT COALESCE(SUM(a.n * b.n), 0) FROM "
+            f"(SELECT item_id, date, COUNT(*) AS n FROM {left} GROUP BY item_id, date) a JOIN "
+            f"(SELECT item_id, date, COUNT(*) AS n FROM {right} GROUP BY item_id, date) b "
+            f"ON a.item_id = b.item_id AND a.date = b.date"
+        )
+    before = cursor.execute(before_sql).fetchone()[0]
+    after = cursor.execute(after_sql).fetchone()[0]
+    return before, after
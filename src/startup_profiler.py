@@ -0,0 +1,85 @@
+import importlib
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+class StartupProfiler:
+    """
+    Records how long each import, initializer and warm-up step takes while the
+    service starts, so cold-start regressions can be traced to a single step.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.entries = []
+
+    def record(self, name, seconds, kind="init", ok=True, error=None):
+        entry = {"name": name, "kind": kind, "seconds": seconds, "ok": ok}
+        if error is not None:
+            entry["error"] = error
+        with self._lock:
+            self.entries.append(entry)
+        return entry
+
+    @contextmanager
+    def measure(self, name, kind="init"):
+        """Time the with-block; failures are recorded and re-raised."""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.record(name, time.perf_counter() - start, kind, ok=False, error=str(e))
+            raise
+        self.record(name, time.perf_counter() - start, kind)
+
+    def import_module(self, name):
+        """Import a module and record the time it added (zero if it was already loaded)."""
+        already_loaded = name in sys.modules
+        with self.measure(f"import {name}", kind="import"):
+            module = importlib.import_module(name)
+        if already_loaded:
+            self.entries[-1]["seconds"] = 0.0
+        return module
+
+    def report(self):
+        with self._lock:
+            return [dict(entry) for entry in self.entries]
+
+    def format_report(self):
+        """Return the recorded steps as a text table, slowest first."""
+        entries = sorted(self.report(), key=lambda entry: entry["seconds"], reverse=True)
+        lines = [f"{'step':<45} {'kind':<8} {'ms':>10}"]
+        lines.append("-" * len(lines[0]))
+        for entry in entries:
+            status = "" if entry["ok"] else f"  FAILED: {entry['error']}"
+            lines.append(f"{entry['name']:<45} {entry['kind']:<8} {entry['seconds'] * 1000:>10.1f}{status}")
+        total = sum(entry["seconds"] for entry in entries)
+        lines.append(f"{'total':<45} {'':<8} {total * 1000:>10.1f}")
+        return "\n".join(lines)
+
+# Process-wide profiler used by the app factory and the warm-up phase
+profiler = StartupProfiler()
+
+if __name__ == "__main__":
+    # Profile a full cold start in this (fresh) process:
+    #   python src/startup_profiler.py
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+    for module_name in ["flask", "flask_cors", "fallback_queries", "database_manager",
+                        "llm_integration", "visualization", "app",
+                        "numpy", "pandas", "matplotlib.pyplot", "ollama"]:
+        try:
+            profiler.import_module(module_name)
+        except ImportError as e:
+            print(f"Could not import {module_name}: {e}")
+
+    app_module = sys.modules.get("app")
+    if app_module is not None:
+        app = app_module.create_app({"WARM_UP": "off"})
+        app_module.warm_up(app)
+
+    print("Startup profile")
+    print("=" * 50)
+    print(profiler.format_report())
@@ -0,0 +1,175 @@
+import argparse
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from data_ingestion import ENCODED_COLUMNS, DataIngestion
+from partitioning import PARTITIONED_VIEWS, day_number, month_bounds
+
+# Messages shown for ineligible products, as in the eligibility export
+INELIGIBLE_MESSAGES = [
+    "This product's cost to Amazon does not allow us to meet customers' pricing expectations. "
+    "Consider reducing the cost. It may take a few weeks for your product to become eligible to advertise "
+    "after you reduce the cost.",
+    "This product is not eligible for advertising because it is out of stock.",
+    "This product is not eligible for advertising because it does not have the Buy Box.",
+    "This product is in a category that cannot be advertised.",
+]
+
+# Deterministic pseudo-random integer in [0, modulo) for an (item, day, stream) triple
+def _noise(item, day, stream, seed, modulo):
+    value = f"(({item} * 2654435761 + {day} * 40503 + {stream} * 1000003 + {seed} * 7919) % 2147483647)"
+    # xor-shift (written as (a | b) - (a & b)) then a Lehmer step; all values fit in 64 bits
+    value = f"((({value} | ({value} >> 13)) - ({value} & ({value} >> 13))) * 48271 % 2147483647)"
+    return f"({value} % {modulo})"
+
+def parse_row_count(value):
+    """Parse '1M', '10m', '250K' or '100000' into an integer."""
+    text = str(value).strip().upper().replace("_", "")
+    multiplier = {"K": 1_000, "M": 1_000_000, "B": 1_000_000_000}.get(text[-1:], 1)
+    if multiplier != 1:
+        text = text[:-1]
+    return int(float(text) * multiplier)
+
+class SyntheticDataGenerator:
+    """
+    Fills a new database with generated data in the layout that
+    DataIngestion.create_tables builds: `items` products with one
+    total_sales_metrics row per product and day, ad sales for a share of them,
+    and a daily eligibility check for a share of the products (the churn).
+    Values are derived from a hash of (item, day, seed), so the same settings
+    always produce the same database. Rows are generated inside SQLite, one
+    monthly partition at a time, so the size is limited by disk, not memory.
+    """
+
+    def __init__(self, db_path, items=1000, days=90, end_date=None, ad_coverage=0.6, churn=0.05,
+                 ineligible_share=0.15, seed=42):
+        if items < 1 or days < 1:
+            raise ValueError("items and days must be at least 1")
+        self.db_path = db_path
+        self.items = int(items)
+        self.days = int(days)
+        # Ending today keeps the "sales today / yesterday" queries meaningful
+        self.end_date = end_date or datetime.now(timezone.utc).date()
+        self.start_date = self.end_date - timedelta(days=self.days - 1)
+        self.ad_coverage = ad_coverage
+        self.churn = churn
+        self.ineligible_share = ineligible_share
+        self.seed = int(seed)
+
+    @classmethod
+    def for_rows(cls, db_path, rows, days=365, **kwargs):
+        """Generator sized so that total_sales_metrics holds about `rows` rows over `days` days."""
+        days = min(days, rows)
+        return cls(db_path, items=max(1, round(rows / days)), days=days, **kwargs)
+
+    def generate(self):
+        """Create the database and return the row count of each table."""
+        if os.path.exists(self.db_path):
+            raise FileExistsError(f"{self.db_path} already exists; generate into a new file")
+        ingestion = DataIngestion(db_path=self.db_path)
+        ingestion.create_tables()
+        ingestion.connect()
+        try:
+            # A throwaway database does not need a rollback journal or fsyncs
+            ingestion.cursor.execute("PRAGMA journal_mode = OFF;")
+            ingestion.cursor.execute("PRAGMA synchronous = OFF;")
+            ingestion.cursor.execute("PRAGMA cache_size = -262144;")
+            self._generate_dimensions(ingestion.cursor)
+            # Each month is generated into temp staging tables and bulk-loaded from there
+            for table_name, columns in ENCODED_COLUMNS.items():
+                ingestion.cursor.execute(f"CREATE TEMP TABLE staged_{table_name} ({columns});")
+            first_day, last_day = day_number(self.start_date), day_number(self.end_date)
+            month = self.start_date.strftime("%Y-%m")
+            while month <= self.end_date.strftime("%Y-%m"):
+                month_first, month_last = month_bounds(month)
+                low, high = max(first_day, month_first), min(last_day, month_last)
+                for table_name in PARTITIONED_VIEWS:
+                    ingestion.cursor.execute(self._fact_sql(table_name, f"temp.staged_{table_name}"), (low, high))
+                self._generate_eligibility(ingestion.cursor, "temp.staged_product_eligibility", low, high)
+                for table_name in ENCODED_COLUMNS:
+                    ingestion.load_encoded(table_name, f"temp.staged_{table_name}")
+                    ingestion.cursor.execute(f"DELETE FROM temp.staged_{table_name};")
+                ingestion.conn.commit()
+                print(f"Generated {month}")
+                following = date.fromisoformat(f"{month}-01") + timedelta(days=32)
+                month = following.strftime("%Y-%m")
+            ingestion.cursor.execute("ANALYZE;")
+            return self.row_counts(ingestion.cursor)
+        finally:
+            ingestion.close()
+
+    def _generate_dimensions(self, cursor):
+        cursor.execute("""WITH RECURSIVE n(k) AS (SELECT 1 UNION ALL SELECT k + 1 FROM n WHERE k < ?)
+            INSERT INTO items (item_key, item_id) SELECT k, CAST(k - 1 AS TEXT) FROM n;""", (self.items,))
+        cursor.executemany("INSERT OR IGNORE INTO eligibility_messages (message) VALUES (?);",
+                           [(message,) for message in INELIGIBLE_MESSAGES])
+
+    def _fact_sql(self, table_name, table):
+        seed = self.seed
+        days = "WITH RECURSIVE d(day) AS (SELECT ? UNION ALL SELECT day + 1 FROM d WHERE day < ?) "
+        # Each product has a stable price and popularity; daily volume varies around them
+        price = f"(5 + {_noise('i.item_key', 0, 1, seed, 19500)} / 100.0)"
+        units = f"({_noise('i.item_key', 0, 2, seed, 20)} * {_noise('i.item_key', 'd.day', 3, seed, 10)} / 5)"
+        if table_name == "total_sales_metrics":
+            return (days + f"INSERT INTO {table} (day, item_key, total_sales, total_units_ordered) "
+                    f"SELECT d.day, i.item_key, ROUND({units} * {price}, 2), {units} FROM d, items i;")
+        impressions = f"(50 + {_noise('i.item_key', 'd.day', 4, seed, 5000)})"
+        clicks = f"({impressions} * {_noise('i.item_key', 'd.day', 5, seed, 40)} / 1000)"
+        units_sold = f"({clicks} * {_noise('i.item_key', 'd.day', 6, seed, 30)} / 100)"
+        cpc = f"(0.2 + {_noise('i.item_key', 'd.day', 7, seed, 300)} / 100.0)"
+        coverage = int(self.ad_coverage * 1000)
+        return (days + f"INSERT INTO {table} (day, item_key, ad_sales, impressions, ad_spend, clicks, units_sold) "
+                f"SELECT d.day, i.item_key, ROUND({units_sold} * {price}, 2), {impressions}, "
+                f"ROUND({clicks} * {cpc}, 2), {clicks}, {units_sold} FROM d, items i "
+                f"WHERE {_noise('i.item_key', 'd.day', 8, seed, 1000)} < {coverage};")
+
+    def _generate_eligibility(self, cursor, table, low, high):
+        # Every product is checked on the first day; afterwards a `churn` share of them per day
+        seed = self.seed
+        ineligible = f"{_noise('i.item_key', 'd.day', 10, seed, 1000)} < {int(self.ineligible_share * 1000)}"
+        message = f"1 + {_noise('i.item_key', 'd.day', 11, seed, len(INELIGIBLE_MESSAGES))}"
+        checked = (f"d.day = {day_number(self.start_date)} OR "
+                   f"{_noise('i.item_key', 'd.day', 9, seed, 1000)} < {int(self.churn * 1000)}")
+        check_ms = f"(d.day * 86400000 + 8 * 3600000 + {_noise('i.item_key', 'd.day', 12, seed, 3600000)})"
+        cursor.execute(f"""WITH RECURSIVE d(day) AS (SELECT ? UNION ALL SELECT day + 1 FROM d WHERE day < ?)
+            INSERT INTO {table} (eligibility_ts, item_key, eligible, message_key)
+            SELECT {check_ms}, i.item_key,
+                   CASE WHEN {ineligible} THEN 0 ELSE 1 END,
+                   CASE WHEN {ineligible} THEN {message} END
+            FROM d, items i WHERE {checked};""", (low, high))
+
+    @staticmethod
+    def row_counts(cursor):
+        counts = {}
+        for table in list(PARTITIONED_VIEWS) + ["product_eligibility", "current_product_eligibility", "items"]:
+            cursor.execute(f"SELECT COUNT(*) FROM {table};")
+            counts[table] = cursor.fetchone()[0]
+        return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic e-commerce database for benchmarking.")
+    parser.add_argument("db_path", help="Database file to create (must not exist)")
+    parser.add_argument("--rows", help="Approximate total_sales_metrics rows, e.g. 1M; sets --items from --days")
+    parser.add_argument("--items", type=int, default=1000, help="Number of products")
+    parser.add_argument("--days", type=int, default=90, help="Number of days of history, ending today")
+    parser.add_argument("--ad-coverage", type=float, default=0.6, help="Share of product-days with ad sales")
+    parser.add_argument("--churn", type=float, default=0.05, help="Share of products re-checked for eligibility each day")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    options = {"ad_coverage": args.ad_coverage, "churn": args.churn, "seed": args.seed}
+    if args.rows:
+        generator = SyntheticDataGenerator.for_rows(args.db_path, parse_row_count(args.rows), days=args.days, **options)
+    else:
+        generator = SyntheticDataGenerator(args.db_path, items=args.items, days=args.days, **options)
+    start = time.perf_counter()
+    try:
+        counts = generator.generate()
+    except FileExistsError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"Generated {generator.items} items x {generator.days} days in {time.perf_counter() - start:.1f}s")
+    for table, count in counts.items():
+        print(f"  {table}: {count:,} rows")
@@ -1,16 +1,51 @@
-import matplotlib.pyplot as plt
-import pandas as pd
+import io
 import os
+import threading
 from datetime import datetime
-import numpy as np
+
+# matplotlib, pandas and numpy are imported on first use (see _load_plotting_libraries)
+# so that importing this module stays cheap for processes that never draw a chart.
+plt = None
+pd = None
+np = None
+
+# pyplot keeps the current figure in process-wide state, so charts are drawn one at a time
+_PYPLOT_LOCK = threading.Lock()
+
+def _load_plotting_libraries():
+    """Import the plotting stack once and bind it to the module globals."""
+    global plt, pd, np
+    if plt is None:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as _plt
+        import pandas as _pd
+        import numpy as _np
+        pd, np, plt = _pd, _np, _plt
 
 class VisualizationManager:
     def __init__(self, output_dir="../visualizations"):
         self.output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), output_dir)
         os.makedirs(self.output_dir, exist_ok=True)
     
+    def warm_up(self):
+        """Load the plotting libraries and render a throwaway figure (fonts, Agg renderer)."""
+        _load_plotting_libraries()
+        with _PYPLOT_LOCK:
+            plt.figure(figsize=(2, 2))
+            plt.bar(['warm-up'], [1])
+            plt.title('warm-up')
+            plt.savefig(io.BytesIO(), format='png')
+            plt.close()
+    
     def create_visualization(self, query_result, user_question, sql_query):
         """Create a visualization based on the query result and question type."""
+        _load_plotting_libraries()
+        with _PYPLOT_LOCK:
+            return self._render(query_result, user_question)
+    
+    def _render(self, query_result, user_question):
+        
         if not query_result["success"]:
             return self._create_error_visualization(user_question, query_result.get("error", "Unknown error"))
         
@@ -0,0 +1,16 @@
+"""
+WSGI entry point for production serving.
+
+    gunicorn -c gunicorn.conf.py
+
+With preload enabled (the default in gunicorn.conf.py) this module is imported
+once in the gunicorn master, so every worker forks from an already built app.
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+
+app = create_app()